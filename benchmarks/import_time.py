@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Start-up time of xtralien.imports in fresh interpreters.
+
+Each statement runs in a new process, so nothing is already imported.
+The first figure is the cost of the import alone; the others add the
+first use of a lazily loaded library:
+
+    PYTHONPATH=src python benchmarks/import_time.py
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+STATEMENTS = [
+    ('python', 'pass'),
+    ('import', 'import xtralien.imports'),
+    ('np', 'import xtralien.imports as i; i.np'),
+    ('zeros', 'import xtralien.imports as i; i.zeros'),
+    ('plt', 'import xtralien.imports as i; i.plt'),
+    ('star', 'from xtralien.imports import *'),
+]
+
+
+def measure(statement, count):
+    """
+    Run `statement` in `count` new interpreters and return the times
+    in seconds.
+    """
+    env = dict(os.environ, MPLBACKEND='Agg')
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', statement], env=env)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', '--count', type=int, default=5)
+    args = parser.parse_args()
+
+    for (name, statement) in STATEMENTS:
+        timings = measure(statement, args.count)
+        print("{:<8} min={:8.1f} ms  median={:8.1f} ms".format(
+            name,
+            timings[0] * 1e3,
+            timings[len(timings) // 2] * 1e3
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput of the 'auto' response parser on synthetic payloads.
+
+Compares the regex based parser the library used to ship with
+process_auto and with a ResponseParser that has already seen the
+command:
+
+    PYTHONPATH=src python benchmarks/parser_throughput.py
+"""
+import argparse
+import re
+import time
+
+import numpy
+
+from xtralien import ResponseParser, process_auto
+
+
+number_regex = r"(\-|\+)?[0-9]+(\.[0-9]+)?(e-?[0-9]+(\.[0-9]+)?)?"
+re_matrix = re.compile(
+    r'(\[({number},{number}(;?))+\])\n?'.format(number=number_regex)
+)
+re_array = re.compile(r'(\[({number}(;?))+\])\n?'.format(number=number_regex))
+re_number = re.compile(r'{number}\n?'.format(number=number_regex))
+
+
+def legacy_auto(x):
+    """
+    The regex based parser, kept here for comparison.
+    """
+    if re_matrix.fullmatch(x):
+        return numpy.array([
+            [float(z) for z in y.split(',')]
+            for y in x.strip('\n[];').split(';')
+        ])
+    elif re_array.fullmatch(x):
+        return numpy.array([float(y) for y in x.strip('\n[];').split(';')])
+    elif re_number.fullmatch(x):
+        return float(x)
+    return x
+
+
+def payload(kind, count):
+    """
+    Build a response holding `count` values.
+    """
+    values = ['{:.6e}'.format(v) for v in numpy.random.rand(count)]
+    if kind == 'array':
+        return '[' + ';'.join(values) + ';]\n'
+    pairs = [','.join(values[i:i + 2]) for i in range(0, count - 1, 2)]
+    return '[' + ';'.join(pairs) + ';]\n'
+
+
+def measure(function, data, budget):
+    """
+    Call `function(data)` for about `budget` seconds and return the
+    number of values parsed per second.
+    """
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < budget or calls == 0:
+        function(data)
+        calls += 1
+        elapsed = time.perf_counter() - start
+    result = function(data)
+    size = result.size if hasattr(result, 'size') else 1
+    return size * calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--budget', type=float, default=0.2,
+                        help='seconds to spend on each measurement')
+    parser.add_argument('--max-size', type=int, default=1000000)
+    args = parser.parse_args()
+
+    cached = ResponseParser()
+    parsers = [
+        ('legacy', legacy_auto),
+        ('auto', process_auto),
+        ('cached', lambda x: cached.parse(x, ('smu1', 'sweep'))),
+    ]
+
+    print("{:<8}{:>10}".format('kind', 'values') + ''.join(
+        '{:>16}'.format(name + ' v/s') for (name, _) in parsers
+    ))
+    for kind in ('array', 'matrix'):
+        count = 10
+        while count <= args.max_size:
+            data = payload(kind, count)
+            print("{:<8}{:>10}".format(kind, count) + ''.join(
+                '{:>16.3e}'.format(measure(function, data, args.budget))
+                for (_, function) in parsers
+            ))
+            count *= 10
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Round trip latency of SocketConnection against a local TCP stand-in.
+
+The stand-in answers every command it receives with a single
+terminated number, so the figures are the library overhead plus
+loopback latency. Compare the framed read with the timeout read:
+
+    PYTHONPATH=src python benchmarks/socket_latency.py
+"""
+import argparse
+import socket
+import threading
+import time
+
+from xtralien import SocketConnection
+
+
+def serve(server, response):
+    """
+    Answer every received packet on every accepted connection.
+    """
+    while True:
+        try:
+            client, _ = server.accept()
+        except OSError:
+            return
+        with client:
+            while True:
+                data = client.recv(576)
+                if not data:
+                    break
+                client.sendall(response)
+
+
+def stand_in(response=b'1.0\n'):
+    """
+    Start a stand-in device on an ephemeral port and return the socket.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    threading.Thread(target=serve, args=(server, response), daemon=True).start()
+    return server
+
+
+def measure(port, count, terminator):
+    """
+    Time `count` round trips and return the latencies in seconds.
+    """
+    conn = SocketConnection('127.0.0.1', port, terminator=terminator)
+    timings = []
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            conn.write('smu1 measurev')
+            conn.read()
+            timings.append(time.perf_counter() - start)
+    finally:
+        conn.close()
+    return sorted(timings)
+
+
+def report(name, timings):
+    count = len(timings)
+    print("{:<10} n={:<6} p50={:8.3f} ms  p99={:8.3f} ms  {:9.1f} cmd/s".format(
+        name,
+        count,
+        timings[count // 2] * 1e3,
+        timings[min(count - 1, int(count * 0.99))] * 1e3,
+        count / sum(timings)
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', '--count', type=int, default=1000)
+    args = parser.parse_args()
+
+    server = stand_in()
+    port = server.getsockname()[1]
+    try:
+        report('framed', measure(port, args.count, b'\n'))
+        # The timeout read costs 70 ms per command, keep the sample small
+        report('timeout', measure(port, min(args.count, 20), None))
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
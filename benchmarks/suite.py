@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmarks of the command, transport, parser and CSV paths.
+
+Devices are emulated (see xtralien.emulator), so no hardware is needed.
+Each case is reported as the median (p50) and 99th percentile (p99)
+time per operation, and operations per second. Calls taking longer than
+PER_CALL, which includes every round trip to a device, are timed one by
+one so p99 is their tail latency. Faster calls can't be timed alone, so
+they are run in batches and the percentiles are of the batch means:
+
+    PYTHONPATH=src python benchmarks/suite.py
+    PYTHONPATH=src python benchmarks/suite.py --save
+    PYTHONPATH=src python benchmarks/suite.py --check
+
+--save stores the results in baseline.json next to this script and
+--check fails if any case's p50 is more than --tolerance slower than
+the baseline. The baseline holds absolute times from the machine it was
+saved on, so --check compares each case relative to the `reference`
+case, a fixed amount of pure Python work run in the same session. That
+only evens out CPU speed, not I/O, so save a new baseline on each
+machine that runs --check.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+
+from xtralien import (
+    Connection,
+    Device,
+    process_array,
+    process_auto,
+    process_matrix,
+    scan_network
+)
+from xtralien.emulator import Emulator, format_array, format_matrix
+import xtralien.imports as imports
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+# Calls slower than this many seconds are timed individually
+PER_CALL = 1e-5
+
+# The case other cases are compared relative to, always run
+REFERENCE = 'reference'
+
+
+class NullConnection(Connection):
+    """
+    A connection that answers every command at once, so only the
+    library's own work is measured.
+    """
+    def __init__(self, response='1.0\n'):
+        super(NullConnection, self).__init__()
+        self.response = response
+
+    def write(self, cmd):
+        pass
+
+    def read(self, wait=True, deadline=None):
+        return self.response
+
+    def close(self):
+        pass
+
+
+def reference_case():
+    return [(REFERENCE, lambda: sum(i * i for i in range(1000)))]
+
+
+def command_cases():
+    device = Device()
+    device.add_connection(NullConnection())
+    oneshot = device.smu1.oneshot.compile(sleep_time=None)
+    return [
+        ('command.call', lambda: device.smu1.oneshot(1.0, sleep_time=None)),
+        ('command.compiled', lambda: oneshot(1.0)),
+    ]
+
+
+def parser_cases():
+    number = '1.234567e-03\n'
+    array = format_array(numpy.random.rand(1000))
+    matrix = format_matrix(numpy.random.rand(500, 2))
+    return [
+        ('parse.auto.number', lambda: process_auto(number)),
+        ('parse.auto.array', lambda: process_auto(array)),
+        ('parse.auto.matrix', lambda: process_auto(matrix)),
+        ('parse.array.1000', lambda: process_array(array)),
+        ('parse.matrix.500x2', lambda: process_matrix(matrix)),
+    ]
+
+
+def transport_cases(stack):
+    emulator = Emulator(port=0, discovery_port=0, matrix_rows=500)
+    emulator.start()
+    stack.append(emulator.close)
+
+    network = Device('127.0.0.1', emulator.port)
+    stack.append(network.close)
+    cases = [
+        ('socket.number', lambda: network.smu1.measurev(sleep_time=None)),
+        # With the connection's default pacing
+        ('socket.number.paced', lambda: network.smu1.measurev()),
+        ('socket.matrix.500x2', lambda: network.smu1.sweep(sleep_time=None)),
+        ('discovery', lambda: scan_network(
+            '127.0.0.1',
+            timeout=0.005,
+            port=emulator.discovery_port,
+            refresh=True
+        )),
+    ]
+    if hasattr(os, 'openpty'):
+        usb = Device(emulator.open_pty())
+        stack.append(usb.close)
+        cases += [
+            ('serial.number', lambda: usb.smu1.measurev(sleep_time=None)),
+            ('serial.matrix.500x2', lambda: usb.smu1.sweep(sleep_time=None)),
+        ]
+    return cases
+
+
+def csv_cases(stack):
+    tmp = tempfile.TemporaryDirectory()
+    stack.append(tmp.cleanup)
+    fname = os.path.join(tmp.name, 'data.csv')
+    data = numpy.random.rand(10000, 4)
+    imports.array_to_csv(data, fname)
+    return [
+        ('csv.write.10000x4', lambda: imports.array_to_csv(data, fname)),
+        ('csv.load.10000x4', lambda: imports.load_csv(fname)),
+    ]
+
+
+def measure(function, budget, batches=50):
+    """
+    Run `function` for about `budget` seconds, returning the time of
+    each call, sorted. Calls faster than PER_CALL are run in `batches`
+    batches instead, returning the time per call of each batch.
+    """
+    clock = time.perf_counter
+    # Pick how to time it from a rough timing of a few calls
+    calls = 0
+    start = clock()
+    while calls < 3 or clock() - start < budget / 20:
+        function()
+        calls += 1
+    each = (clock() - start) / calls
+
+    if each >= PER_CALL:
+        timings = []
+        expires = clock() + budget
+        while len(timings) < batches or clock() < expires:
+            start = clock()
+            function()
+            timings.append(clock() - start)
+        return sorted(timings)
+
+    number = max(1, int(budget / batches / each))
+
+    timings = []
+    for _ in range(batches):
+        start = clock()
+        for _ in range(number):
+            function()
+        timings.append((clock() - start) / number)
+    return sorted(timings)
+
+
+def summarise(timings):
+    count = len(timings)
+    return {
+        'p50': timings[count // 2],
+        'p99': timings[min(count - 1, int(count * 0.99))],
+        'ops': count / sum(timings),
+    }
+
+
+def relative(results, name):
+    """
+    The p50 of case `name` as a multiple of the reference case's.
+    """
+    return results[name]['p50'] / results[REFERENCE]['p50']
+
+
+def slowdown(results, baseline, name):
+    """
+    How much slower case `name` is than in the baseline, relative to
+    the reference case when both have it.
+    """
+    if REFERENCE in baseline and REFERENCE in results:
+        return relative(results, name) / relative(baseline, name) - 1
+    return results[name]['p50'] / baseline[name]['p50'] - 1
+
+
+def report(name, result, change=None):
+    line = "{:<22} p50={:10.3f} us  p99={:10.3f} us  {:12.1f} op/s".format(
+        name,
+        result['p50'] * 1e6,
+        result['p99'] * 1e6,
+        result['ops']
+    )
+    if change is not None:
+        line += "  {:+6.1f}%".format(change * 100)
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-k', '--filter', default='*',
+                        help='only run cases matching this pattern')
+    parser.add_argument('--budget', type=float, default=0.5,
+                        help='seconds to spend on each case')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the baseline')
+    parser.add_argument('--check', action='store_true',
+                        help='fail on a regression against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed relative p50 slowdown for --check')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    stack = []
+    results = {}
+    try:
+        cases = (
+            reference_case() +
+            command_cases() +
+            parser_cases() +
+            transport_cases(stack) +
+            csv_cases(stack)
+        )
+        for (name, function) in cases:
+            if name != REFERENCE and not fnmatch.fnmatch(name, args.filter):
+                continue
+            results[name] = summarise(measure(function, args.budget))
+            change = None
+            if name in baseline:
+                change = slowdown(results, baseline, name)
+            report(name, results[name], change)
+    finally:
+        for cleanup in reversed(stack):
+            cleanup()
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    if args.check:
+        regressions = [
+            name for name in results
+            if name != REFERENCE and name in baseline and
+            slowdown(results, baseline, name) > args.tolerance
+        ]
+        if regressions:
+            print("Slower than the baseline: " + ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,7 +17,7 @@ setup(
     url='https://github.com/xtralien/pyxtralien.git',
     packages=find_packages(where='src', exclude=['additional']),
     package_dir={'': 'src'},
-    python_requires='>=3.5',
+    python_requires='>=3.7',
     extras_require={
         'Serial': ['pyserial'],
         'keithley': ['pyVISA'],
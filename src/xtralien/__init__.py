@@ -4,18 +4,19 @@
 Xtralien
 """
 # Create a basic logger to make logging easier
+import concurrent.futures
 import datetime
+import functools
+import importlib
+import io
 import logging
 import os
-import random
-import re
+import select
 import socket
 import sys
 import threading
 import time
 
-from xtralien.serial_utils import serial_ports
-
 log_levels = {
     'debug': logging.DEBUG,
     'info': logging.INFO,
@@ -23,70 +24,99 @@ log_levels = {
     'error': logging.ERROR
 }
 
-logging.basicConfig()
 logger = logging.getLogger('Xtralien')
 logger.setLevel(
     log_levels.get(os.getenv('LOG', 'warn').lower(), logging.WARNING)
 )
 
-try:
-    import numpy
-except ImportError:
-    logger.warn("Numpy not found, array and matrix will fail")
-
-
 if sys.version_info.major < 3:
     logger.warn("Module not supported on Python 2.x")
 
-# Try and import the serial module (supports USB-serial communication)
-try:
-    import serial
-except ImportError:
-    serial = None
-    logger.warn("The serial module was not found, USB not supported")
+from xtralien.pacing import PACED, AdaptivePacing, FixedPacing  # noqa: E402,F401
+
+# numpy and serial are optional and slow to import, so they are only
+# imported when first needed, along with setting up logging.
+_optional = {}
+_optional_warnings = {
+    'numpy': "Numpy not found, array and matrix will fail",
+    'serial': "The serial module was not found, USB not supported",
+}
+_logging_configured = False
 
 
-def process_strip(x):
-    return x.strip('\n[];')
+def _configure_logging():
+    global _logging_configured
+    if not _logging_configured:
+        _logging_configured = True
+        logging.basicConfig()
 
 
-def process_array(x):
-    data = [float(y) for y in x.strip('\n[];').split(';')]
+def _import_optional(name):
+    """
+    Import an optional module on first use, returning None if it isn't
+    installed.
+    """
     try:
-        return numpy.array(data)
-    except NameError:
-        return data
+        return _optional[name]
+    except KeyError:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = None
+        _configure_logging()
+        logger.warning(_optional_warnings[name])
+    _optional[name] = module
+    return module
+
+
+def __getattr__(name):
+    if name in _optional_warnings:
+        return _import_optional(name)
+    if name == 'serial_ports':
+        from xtralien.serial_utils import serial_ports
+        return serial_ports
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
 
 
-def process_matrix(x):
-    data = [
-        [float(z) for z in y.split(',')]
-        for y in x.strip('\n[];').split(';')
-    ]
-    try:
-        return numpy.array(data)
-    except NameError:
-        return data
+def process_strip(x):
+    return x.strip('\n[];')
 
 
-number_regex = r"(\-|\+)?[0-9]+(\.[0-9]+)?(e-?[0-9]+(\.[0-9]+)?)?"
-re_matrix = re.compile(
-    r'(\[({number},{number}(;?))+\])\n?'.format(number=number_regex)
-)
-re_array = re.compile(r'(\[({number}(;?))+\])\n?'.format(number=number_regex))
-re_number = re.compile(r'{number}\n?'.format(number=number_regex))
+def process_array(x):
+    body = x.strip('\n[];')
+    numpy = _import_optional('numpy')
+    if numpy is None:
+        return [float(y) for y in body.split(';')]
+    data = numpy.fromstring(body, sep=';')
+    if data.size != body.count(';') + 1:
+        raise ValueError("Could not parse array {!r}".format(x))
+    return data
 
 
-def process_auto(x=None):
-    if x is None:
-        return x
-    if re_matrix.fullmatch(x):
-        return process_matrix(x)
-    elif re_array.fullmatch(x):
-        return process_array(x)
-    elif re_number.fullmatch(x):
-        return float(x)
-    elif '\n' in x:
+def process_matrix(x):
+    body = x.strip('\n[];')
+    rows = body.count(';') + 1
+    columns = body.count(',', 0, body.find(';')) + 1
+    if columns < 2:
+        raise ValueError("Could not parse matrix {!r}".format(x))
+    numpy = _import_optional('numpy')
+    if numpy is None:
+        return [[float(z) for z in y.split(',')] for y in body.split(';')]
+    data = numpy.fromstring(body.replace(',', ';'), sep=';')
+    if data.size != rows * columns:
+        raise ValueError("Could not parse matrix {!r}".format(x))
+    return data.reshape(rows, columns)
+
+
+def process_number(x):
+    return float(x)
+
+
+def process_lines(x):
+    if '\n' in x:
         split_string = x.strip('\n;[]').split('\n')
         if len(split_string) < 2:
             return split_string[0]
@@ -95,22 +125,184 @@ def process_auto(x=None):
         return x
 
 
+def detect_format(x):
+    """
+    Pick the processor for a response by looking at how it starts,
+    rather than matching the whole response.
+    """
+    if x.startswith('['):
+        if ',' in x:
+            return process_matrix
+        return process_array
+    elif x and x[0] in '+-0123456789':
+        return process_number
+    return process_lines
+
+
+def process_auto(x=None):
+    if x is None:
+        return x
+    processor = detect_format(x)
+    try:
+        return processor(x)
+    except ValueError:
+        return process_lines(x)
+
+
+class ResponseParser(object):
+    """
+    The 'auto' formatter, remembering the format of each command's
+    response so that repeated commands skip detection.
+    """
+    numeric = (process_number, process_array, process_matrix)
+
+    def __init__(self):
+        self.formats = {}
+
+    def parse(self, x=None, path=None):
+        if x is None:
+            return x
+        processor = self.formats.get(path)
+        if processor is not None:
+            try:
+                return processor(x)
+            except ValueError:
+                pass
+
+        processor = detect_format(x)
+        try:
+            data = processor(x)
+        except ValueError:
+            return process_lines(x)
+        # Only remember numeric formats, an error message shouldn't stop
+        # later responses from being parsed
+        if path is not None and processor in self.numeric:
+            self.formats[path] = processor
+        return data
+
+    __call__ = parse
+
+
+class StreamParser(object):
+    """
+    Decodes an array or matrix response as it arrives, in blocks of
+    `rows` rows, so only the current block and an incomplete row are
+    held in memory.
+    """
+    def __init__(self, rows=1024):
+        self.rows = rows
+        self.columns = None
+        self._pending = bytearray()
+        self._started = False
+        self._block = None
+        self._filled = 0
+
+    def _decode(self, text):
+        if self.columns is None:
+            first = text.find(';')
+            self.columns = text.count(',', 0, first) + 1
+        numpy = _import_optional('numpy')
+        values = numpy.fromstring(text.replace(',', ';'), sep=';')
+        if values.size % self.columns:
+            raise ValueError("Incomplete row in {!r}".format(text))
+        if self.columns == 1:
+            return values
+        return values.reshape(-1, self.columns)
+
+    def _add(self, values):
+        blocks = []
+        while len(values):
+            if self._block is None:
+                shape = (self.rows,) + values.shape[1:]
+                self._block = _import_optional('numpy').empty(shape)
+                self._filled = 0
+            count = min(len(values), self.rows - self._filled)
+            self._block[self._filled:self._filled + count] = values[:count]
+            self._filled += count
+            values = values[count:]
+            if self._filled == self.rows:
+                blocks.append(self._block)
+                self._block = None
+        return blocks
+
+    def feed(self, data):
+        """
+        Add received bytes, returning a list of any completed blocks.
+        """
+        pending = self._pending
+        pending += data
+        if not self._started:
+            start = len(pending) - len(pending.lstrip(b'\n['))
+            if start == len(pending):
+                return []
+            del pending[:start]
+            self._started = True
+
+        end = pending.rfind(b';')
+        if end < 0:
+            return []
+        text = pending[:end].decode('utf-8')
+        del pending[:end + 1]
+        if not text:
+            return []
+        return self._add(self._decode(text))
+
+    def finish(self):
+        """
+        Decode whatever is left, returning the final partial block or
+        None if there is nothing left.
+        """
+        text = self._pending.decode('utf-8').strip('\n[];')
+        del self._pending[:]
+        if text:
+            self._add(self._decode(text))
+        if self._block is None or not self._filled:
+            return None
+        block = self._block[:self._filled]
+        self._block = None
+        return block
+
+
+def _identity(x):
+    return x
+
+
 class Device(object):
+    """
+    A connection to an Xtralien device.
+
+    Commands are built up through attributes and items, so
+    `dev.smu1.oneshot(1.0)` sends 'smu1 oneshot 1.0'. Each command is
+    built separately and commands are sent one at a time, so a Device
+    can be shared between threads.
+    """
     connections = []
-    current_selection = []
+    # Threads used to deliver responses to callbacks
+    callback_workers = 4
     formatters = {
         'strip': process_strip,
         'array': process_array,
         'matrix': process_matrix,
-        'number': lambda x: float(x),
+        'number': process_number,
         'none': lambda x: x,
         'auto': process_auto
     }
 
     def __init__(self, addr=None, port=None, serial_timeout=0.1):
         self.connections = []
-        self.current_selection = []
-        self.in_progress = False
+        self.lock = threading.RLock()
+        self.parser = ResponseParser()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._active = 0
+        # Set while a response is being streamed, see `stream`
+        self._streaming = False
+        # CommandMetrics, when instrumented
+        self.metrics = None
+        # ResponseCache, when caching responses
+        self.cache = None
+        # StateMirror, when skipping redundant set commands
+        self.mirror = None
 
         if port:
             self.add_connection(SocketConnection(addr, port))
@@ -132,9 +324,31 @@ class Device(object):
     def add_connection(self, connection):
         self.connections.append(connection)
 
-    def command(self, command, returns=False, sleep_time=0.001):
-        if sleep_time is not None:
-            time.sleep(sleep_time)
+    @property
+    def in_progress(self):
+        return self._active > 0
+
+    def command(self, command, returns=False, sleep_time=PACED, deadline=None):
+        if self.cache is not None:
+            self.cache.observe(command)
+        if self.mirror is not None:
+            return self.mirror.send(
+                command,
+                self._command,
+                returns,
+                sleep_time,
+                deadline,
+                connection=self.connections[0] if self.connections else None
+            )
+        return self._command(command, returns, sleep_time, deadline)
+
+    def _command(self, command, returns, sleep_time, deadline):
+        if self.metrics is not None and self.connections:
+            (response, sample) = self._timed_command(
+                command, returns, sleep_time, deadline
+            )
+            self.metrics.record(sample)
+            return response
         if self.connections == []:
             logger.error(
                 "Can't send command '{cmd}'\
@@ -142,14 +356,16 @@ class Device(object):
                     cmd=command
                 )
             )
-        for conn in self.connections:
-            if True:  # try:
-                conn.write(command)
-                return conn.read(returns)
-            else:  # except (Exception, e):
-                # print(e)
-                conn.close()
-                continue
+        with self.lock:
+            self._check_streaming()
+            self._active += 1
+            try:
+                for conn in self.connections:
+                    self._pace(conn, sleep_time)
+                    conn.write(command)
+                    return self._read(conn, returns, deadline)
+            finally:
+                self._active -= 1
         logger.error(
             "Can't send command '{cmd}'\
             because there are no open connections".format(
@@ -157,7 +373,153 @@ class Device(object):
             )
         )
 
+    def _check_streaming(self):
+        # A stream only holds the lock while reading each chunk, so a
+        # command from any thread would land in the middle of it
+        if self._streaming:
+            raise RuntimeError(
+                "Can't send a command while a response is being streamed"
+            )
+
+    @staticmethod
+    def _pace(conn, sleep_time):
+        """
+        Wait before writing to `conn`, for `sleep_time` seconds or as
+        long as its pacing says if PACED.
+        """
+        if sleep_time is PACED:
+            pacing = getattr(conn, 'pacing', None)
+            sleep_time = 0.001 if pacing is None else pacing.wait_time()
+        if sleep_time:
+            time.sleep(sleep_time)
+
+    @staticmethod
+    def _read(conn, returns, deadline):
+        """
+        Read the response to a command just written to `conn`, keeping
+        its pacing up to date.
+        """
+        pacing = getattr(conn, 'pacing', None)
+        if pacing is None:
+            return conn.read(returns, deadline=deadline)
+        pacing.sent(returns)
+        try:
+            response = conn.read(returns, deadline=deadline)
+        except (TimeoutError, OSError):
+            pacing.failed()
+            raise
+        pacing.received()
+        return response
+
+    def _timed_command(self, command, returns, sleep_time, deadline,
+                       path=None):
+        """
+        Send a command in the same way as `command`, timing each phase.
+
+        Returns the response and its CommandSample.
+        """
+        from xtralien.metrics import (
+            CommandSample, command_path, response_bytes
+        )
+        sample = CommandSample(command_path(command, path))
+        clock = time.perf_counter
+
+        start = clock()
+        with self.lock:
+            self._check_streaming()
+            locked = clock()
+            self._active += 1
+            try:
+                conn = self.connections[0]
+                self._pace(conn, sleep_time)
+                slept = clock()
+                conn.write(command)
+                written = clock()
+                if returns:
+                    conn.wait(deadline)
+                first_byte = clock()
+                if deadline is not None:
+                    deadline = max(0, deadline - (first_byte - written))
+                response = self._read(conn, returns, deadline)
+                drained = clock()
+            finally:
+                self._active -= 1
+
+        sample.lock = locked - start
+        sample.sleep = slept - locked
+        sample.write = written - slept
+        sample.first_byte = first_byte - written
+        sample.drain = drained - first_byte
+        sample.total = drained - start
+        sample.bytes_out = len(command)
+        sample.bytes_in = response_bytes(response)
+        return (response, sample)
+
+    def _sampled_command(self, command, returns, sleep_time, deadline, path,
+                         samples):
+        # `_timed_command` for the state mirror, which only passes
+        # the response on
+        (response, sample) = self._timed_command(
+            command, returns, sleep_time, deadline, path
+        )
+        samples.append(sample)
+        return response
+
+    def instrument(self, metrics=None, hooks=()):
+        """
+        Record the timings of every command in `metrics`, a new
+        CommandMetrics calling `hooks` by default, and return it.
+
+        Set `metrics` back to None to stop.
+        """
+        if metrics is None:
+            from xtralien.metrics import CommandMetrics
+            metrics = CommandMetrics(hooks)
+        self.metrics = metrics
+        return metrics
+
+    def cache_responses(self, ttl=1.0, maxsize=256, ttls=None, cache=None):
+        """
+        Answer repeated queries from `cache`, a new ResponseCache by
+        default, and return it. See xtralien.cache for what is cached.
+
+        Set `cache` back to None to stop.
+        """
+        if cache is None:
+            from xtralien.cache import ResponseCache
+            cache = ResponseCache(ttl, maxsize, ttls)
+        self.cache = cache
+        return cache
+
+    def mirror_state(self, mirror=None):
+        """
+        Skip set commands that wouldn't change anything, remembering
+        what was written in `mirror`, a new StateMirror by default, and
+        return it. See xtralien.mirror for how it is kept up to date.
+
+        Set `mirror` back to None to stop.
+        """
+        if mirror is None:
+            from xtralien.mirror import StateMirror
+            mirror = StateMirror()
+        self.mirror = mirror
+        return mirror
+
+    def sync(self):
+        """
+        Forget the cached responses and mirrored state, e.g. after the
+        device was changed by something else.
+        """
+        if self.cache is not None:
+            self.cache.clear()
+        if self.mirror is not None:
+            self.mirror.clear()
+
     def close(self):
+        # Let queued callbacks finish before the connections go
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         for conn in self.connections:
             conn.close()
 
@@ -198,58 +560,231 @@ class Device(object):
             self.eeprom.set(16383-i, (_serial & 0xff), response=0)
             _serial >>= 8
             time.sleep(0.1)
+        if self.cache is not None:
+            self.cache.invalidate(('serial',))
 
         return self.serial
 
-    def __getattribute__(self, x):
-        if '__' in x or x in object.__dir__(self):
-            return object.__getattribute__(self, x)
-        else:
-            self.current_selection.append(x)
-            return self
+    def __getattr__(self, x):
+        # Only called for names that aren't real attributes
+        if '__' in x:
+            raise AttributeError(x)
+        return Command(self, (x,))
 
     def __getitem__(self, x):
-        self.current_selection.append(x)
-        return self
+        return Command(self, (x,))
+
+    def get_formatter(self, returns, kwargs, path=None):
+        if not returns:
+            return _identity
+        formatter = self.formatters.get(kwargs.get('format', 'auto'), _identity)
+        if formatter is process_auto and path is not None:
+            return functools.partial(self.parser.parse, path=path)
+        return formatter
 
     def __call__(self, *args, **kwargs):
-        sleep_time = kwargs.get("sleep_time", 0.001)
-        self.current_selection += args
-        returns = kwargs.get('response', True) or kwargs.get('callback', False)
-        command = ' '.join([str(x) for x in self.current_selection])
-        self.current_selection = []
+        return self.call((), args, **kwargs)
+
+    def call(self, selection, args=(), **kwargs):
+        """
+        Send the command made up of `selection` and `args`.
+
+        If a `callback` is given the command is queued and the callback
+        is called with the response from a worker thread, returning a
+        Future for the callback's result.
+        """
+        sleep_time = kwargs.get("sleep_time", PACED)
+        deadline = kwargs.get("deadline", None)
+        callback = kwargs.get('callback', None)
+        returns = kwargs.get('response', True) or callback
+        command = ' '.join([str(x) for x in selection + args])
+        formatter = self.get_formatter(returns, kwargs, selection)
+
+        if self.cache is not None and not callback and returns:
+            words = tuple(str(x) for x in selection + args)
+            ttl = self.cache.ttl_for(words)
+            if ttl is not False:
+                key = (words, kwargs.get('format', 'auto'))
+                (found, response) = self.cache.get(key)
+                if not found:
+                    generation = self.cache.generation
+                    response = self.send(
+                        command,
+                        returns,
+                        formatter,
+                        sleep_time,
+                        deadline,
+                        path=selection
+                    )
+                    self.cache.put(key, response, ttl, generation)
+                return response
 
-        def formatter(x):
-            return x
+        if callback:
+            return self.executor.submit(
+                self._callback,
+                callback,
+                command,
+                formatter,
+                sleep_time,
+                deadline,
+                selection
+            )
 
-        if returns:
-            try:
-                formatter = self.formatters.get(
-                    kwargs.get('format', 'auto'),
-                    formatter
+        return self.send(
+            command,
+            returns,
+            formatter,
+            sleep_time,
+            deadline,
+            path=selection
+        )
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.callback_workers,
+                    thread_name_prefix='xtralien-callback'
                 )
-            except KeyError:
-                if kwargs.get('format', None):
-                    logger.warning('Formatter not found')
+            return self._executor
 
-        callback = kwargs.get('callback', None)
+    def _callback(self, callback, command, formatter, sleep_time, deadline,
+                  path=None):
+        try:
+            return callback(
+                self.send(
+                    command, True, formatter, sleep_time, deadline, path
+                )
+            )
+        except Exception:
+            logger.exception("Callback for '%s' failed", command)
+            raise
+
+    def send(self, command, returns, formatter, sleep_time=PACED,
+             deadline=None, path=None):
+        """
+        Send a built command and format the response.
+
+        `path` is the command without its arguments, used to group
+        metrics; without one the numeric arguments are left out.
+        """
+        if self.metrics is not None and self.connections:
+            if self.cache is not None:
+                self.cache.observe(command)
+            if self.mirror is None:
+                (response, sample) = self._timed_command(
+                    command, returns, sleep_time, deadline, path
+                )
+            else:
+                samples = []
+                response = self.mirror.send(
+                    command,
+                    self._sampled_command,
+                    returns,
+                    sleep_time,
+                    deadline,
+                    path,
+                    samples,
+                    connection=self.connections[0]
+                )
+                if not samples:
+                    # Skipped, so there is nothing to time
+                    return formatter(response)
+                sample = samples[0]
+            formatting = time.perf_counter()
+            response = formatter(response)
+            sample.format = time.perf_counter() - formatting
+            sample.total += sample.format
+            self.metrics.record(sample)
+            return response
+
+        return formatter(
+            self.command(
+                command,
+                returns=returns,
+                sleep_time=sleep_time,
+                deadline=deadline
+            )
+        )
 
-        if callback:
-            def async_function():
-                while self.in_progress:
-                    continue
-                self.in_progress = True
-                data = formatter(self.command(command, returns=True))
-                self.in_progress = False
-                callback(data)
-            return threading.Thread(target=async_function).start()
-
-        self.in_progress = True
-        data = formatter(
-            self.command(command, returns=returns, sleep_time=sleep_time)
+    def compile(self, selection=(), response=True, format='auto',
+                sleep_time=PACED, deadline=None):
+        """
+        Compile a command for repeated use.
+
+            oneshot = dev.smu1.oneshot.compile()
+            for v in voltages:
+                data = oneshot(v)
+        """
+        return CompiledCommand(
+            self,
+            selection,
+            response=response,
+            format=format,
+            sleep_time=sleep_time,
+            deadline=deadline
         )
-        self.in_progress = False
-        return data
+
+    def stream(self, selection=(), args=(), rows=1024, sleep_time=PACED,
+               deadline=None):
+        """
+        Send a command and yield its array or matrix response in numpy
+        blocks of `rows` rows as it arrives.
+
+            for block in dev.smu1.sweep.stream(0, 1, 0.001):
+                process(block)
+
+        The final block holds whatever rows are left over. Until the
+        stream is finished or closed, other commands to the device raise
+        RuntimeError, from any thread. The lock is only held while each
+        chunk is read, so a stream that is never finished can't block
+        other threads. Stopping early (with `close()`, or by dropping
+        the stream) discards the rest of the response.
+        """
+        command = ' '.join([str(x) for x in selection + args])
+        parser = StreamParser(rows)
+        for observer in (self.cache, self.mirror):
+            if observer is not None:
+                observer.observe(command)
+        with self.lock:
+            self._check_streaming()
+            conn = self.connection
+            self._pace(conn, sleep_time)
+            conn.write(command)
+            pacing = getattr(conn, 'pacing', None)
+            if pacing is not None:
+                pacing.sent(True)
+            self._streaming = True
+        terminator = getattr(conn, 'terminator', None)
+        tail = b''
+        chunks = conn.read_chunks(deadline=deadline)
+        try:
+            while True:
+                with self.lock:
+                    data = next(chunks, None)
+                if data is None:
+                    break
+                if terminator:
+                    tail = (tail + data)[-len(terminator):]
+                for block in parser.feed(data):
+                    yield block
+        except GeneratorExit:
+            if terminator and tail != terminator:
+                # Stopped early, don't leave the rest of the response
+                # for the next command
+                with self.lock:
+                    for _ in chunks:
+                        continue
+            raise
+        finally:
+            chunks.close()
+            self._streaming = False
+        if pacing is not None:
+            pacing.received()
+        block = parser.finish()
+        if block is not None:
+            yield block
 
     def __repr__(self):
         if len(self.connections):
@@ -260,45 +795,69 @@ class Device(object):
             return "<Device connection=None/>"
 
     @staticmethod
-    def discover(broadcast_address=None, timeout=0.1, *args, **kwargs):
-        broadcast_address = broadcast_address or '<broadcast>'
-        udp_socket = socket.socket(
-            family=socket.AF_INET,
-            type=socket.SOCK_DGRAM
+    def scan(broadcast_address=None, timeout=0.1, refresh=False, ttl=None):
+        """
+        Find devices on the network without connecting to them,
+        returning a list of DeviceInfo.
+
+        Results are cached for `ttl` seconds (`discovery_ttl` by
+        default) unless `refresh` is set.
+        """
+        return scan_network(
+            broadcast_address,
+            timeout=timeout,
+            refresh=refresh,
+            ttl=ttl
         )
-        udp_socket.bind(('0.0.0.0', random.randrange(6000, 50000)))
-        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        udp_socket.settimeout(timeout)
-        udp_socket.sendto(b"xtra", (broadcast_address, 8889))
-        devices = []
-        try:
-            start_time = time.time()
-            while True:
-                if time.time() > (start_time + timeout):
-                    break
-                (_, ip_addr) = udp_socket.recvfrom(4)
-                if ip_addr:
-                    start_time = time.time()
-                devices.append(Device(addr=ip_addr[0], port=8888))
-        except socket.timeout:
-            pass
-        finally:
-            udp_socket.close()
-        return devices
 
-    def dup(self):
-        return DeviceDuplicate(self)
+    @staticmethod
+    def discover(broadcast_address=None, timeout=0.1, *args, **kwargs):
+        """
+        Find devices on the network and connect to each of them.
+
+        The network is always scanned again, as a cached result could
+        include devices that have since gone.
+        """
+        return [
+            info.connect(*args, **kwargs)
+            for info in Device.scan(broadcast_address, timeout, refresh=True)
+        ]
+
+    def dup(self, selection=()):
+        return DeviceDuplicate(self, selection)
+
+    def batch(self, window=16, separator=b'\n', sleep_time=PACED,
+              deadline=None):
+        """
+        Queue commands and send them together.
+
+            with dev.batch() as b:
+                b.smu1.set.voltage(1, response=0)
+                current = b.smu1.measurei()
+            print(current.result(), b.results)
+
+        Up to `window` commands that expect a response are sent in a
+        single write, joined by `separator`, before their responses are
+        read back in order, one terminated frame each. Commands sent with
+        `response=0` never wait, but a command with a response that
+        follows them starts a new write, which first discards anything
+        they replied (such as an error), as for commands sent one by
+        one. Otherwise each later read would get the previous response.
+        """
+        return Batch(
+            self,
+            window=window,
+            separator=separator,
+            sleep_time=sleep_time,
+            deadline=deadline
+        )
 
     @staticmethod
     def USB(com=None, *args, **kwargs):
         if com is None:
-            while True:
-                try:
-                    com = serial_ports()[0]
-                except IndexError:
-                    continue
-                else:
-                    break
+            from xtralien.watcher import DeviceWatcher
+            with DeviceWatcher() as watcher:
+                com = watcher.wait_for_device()
 
         return Device(com, *args, **kwargs)
 
@@ -321,53 +880,461 @@ class Device(object):
 
     @staticmethod
     def first(*args, **kwargs):
-        while True:
-            try:
+        from xtralien.watcher import DeviceWatcher
+        delay = 0.05
+        with DeviceWatcher() as watcher:
+            while True:
+                if watcher.ports:
+                    return Device.USB(sorted(watcher.ports)[0], *args, **kwargs)
                 try:
-                    com = serial_ports()[0]
-                    return Device.USB(com, *args, **kwargs)
+                    found = Device.scan(refresh=True)
+                    return found[0].connect(*args, **kwargs)
                 except IndexError:
-                    return Device.discover(*args, **kwargs)[0]
-            except IndexError:
+                    # Wake up early for a USB device, otherwise scan again
+                    watcher.changes(delay)
+                    delay = min(delay * 2, 1.0)
+
+
+class DeviceInfo(object):
+    """
+    A device found on the network, which is only connected to when
+    `connect()` is called.
+    """
+    __slots__ = ('host', 'port')
+
+    def __init__(self, host, port=8888):
+        self.host = host
+        self.port = port
+
+    def connect(self, *args, **kwargs):
+        return Device(self.host, self.port, *args, **kwargs)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, DeviceInfo) and
+            (self.host, self.port) == (other.host, other.port)
+        )
+
+    def __hash__(self):
+        return hash((self.host, self.port))
+
+    def __repr__(self):
+        return "<DeviceInfo {host}:{port} />".format(
+            host=self.host,
+            port=self.port
+        )
+
+
+# Seconds to reuse the results of a network scan for
+discovery_ttl = 10.0
+_discovery_cache = {}
+
+
+def broadcast_addresses():
+    """
+    The broadcast address of every local IPv4 interface, as well as
+    the general broadcast address.
+    """
+    addresses = ['<broadcast>']
+    try:
+        import fcntl
+        import struct
+        interfaces = socket.if_nameindex()
+    except (ImportError, AttributeError, OSError):
+        return addresses
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for (_, name) in interfaces:
+            try:
+                request = struct.pack('256s', name.encode('utf-8')[:15])
+                # SIOCGIFBRDADDR
+                reply = fcntl.ioctl(sock.fileno(), 0x8919, request)
+            except OSError:
+                continue
+            address = socket.inet_ntoa(reply[20:24])
+            if address not in ('0.0.0.0', '127.0.0.1') and (
+                address not in addresses
+            ):
+                addresses.append(address)
+    finally:
+        sock.close()
+    return addresses
+
+
+def scan_network(broadcast_address=None, timeout=0.1, port=8889,
+                 refresh=False, ttl=None):
+    """
+    Send a discovery request to every interface at once, then gather
+    replies until none arrive for `timeout` seconds.
+
+    Returns a list of DeviceInfo, without connecting to any of them.
+    """
+    _configure_logging()
+    if broadcast_address is None:
+        addresses = broadcast_addresses()
+    else:
+        addresses = [broadcast_address]
+    key = (tuple(addresses), port)
+    if ttl is None:
+        ttl = discovery_ttl
+
+    cached = _discovery_cache.get(key)
+    if cached is not None and not refresh and cached[0] > time.monotonic():
+        return list(cached[1])
+
+    found = []
+    udp_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    try:
+        udp_socket.bind(('0.0.0.0', 0))
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        for address in addresses:
+            try:
+                udp_socket.sendto(b"xtra", (address, port))
+            except OSError as e:
+                logger.debug("Can't send discovery to %s: %s", address, e)
+
+        while select.select([udp_socket], [], [], timeout)[0]:
+            try:
+                (_, ip_addr) = udp_socket.recvfrom(4)
+            except OSError:
+                # e.g. an ICMP port unreachable from a previous send
                 continue
+            info = DeviceInfo(ip_addr[0])
+            if info not in found:
+                found.append(info)
+    finally:
+        udp_socket.close()
+
+    # Don't remember finding nothing, devices may still be starting
+    if found:
+        _discovery_cache[key] = (time.monotonic() + ttl, found)
+    return list(found)
 
 
 class DeviceDuplicate(object):
-    def __init__(self, device):
+    """
+    Sends commands that start with a fixed base, from `dev.smu1.dup()`.
+    """
+    def __init__(self, device, command_base=()):
         self.device = device
-        self.command_base = self.device.current_selection
-        self.device.current_selection = []
-        self.current_selection = []
+        self.command_base = tuple(command_base)
 
-    def __getattribute__(self, x):
-        if '__' in x or x in object.__dir__(self):
-            return object.__getattribute__(self, x)
-        else:
-            self.current_selection.append(x)
-            return self
+    def __getattr__(self, x):
+        # Only called for names that aren't real attributes
+        if '__' in x:
+            raise AttributeError(x)
+        return Command(self, (x,))
 
     def __getitem__(self, x):
-        self.current_selection.append(x)
-        return self
+        return Command(self, (x,))
+
+    def __call__(self, *args, **kwargs):
+        return self.call((), args, **kwargs)
+
+    def call(self, selection, args=(), **kwargs):
+        return self.device.call(self.command_base + selection, args, **kwargs)
+
+
+class Command(object):
+    """
+    A command built up through attribute and item access, which is
+    passed to `target.call()` along with any arguments when called.
+    """
+    __slots__ = ('target', 'selection')
+
+    def __init__(self, target, selection=()):
+        self.target = target
+        self.selection = selection
+
+    def __getattr__(self, x):
+        if x.startswith('__'):
+            raise AttributeError(x)
+        return Command(self.target, self.selection + (x,))
+
+    def __getitem__(self, x):
+        return Command(self.target, self.selection + (x,))
 
     def __call__(self, *args, **kwargs):
-        self.device.current_selection = []
-        response = self.device(
-            ' '.join(self.command_base + self.current_selection),
-            *args,
-            **kwargs
+        return self.target.call(self.selection, args, **kwargs)
+
+    def compile(self, **kwargs):
+        return self.target.compile(self.selection, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self.target.stream(self.selection, args, **kwargs)
+
+    def dup(self):
+        return self.target.dup(self.selection)
+
+    def __repr__(self):
+        return "<Command '{}'/>".format(
+            ' '.join(str(x) for x in self.selection)
         )
-        self.current_selection = []
-        return response
+
+
+class CompiledCommand(object):
+    """
+    A command with its path encoded once, see `Device.compile()`.
+
+    Calling it only has to format the arguments before sending.
+    """
+    __slots__ = (
+        'device',
+        'path',
+        'prefix',
+        'returns',
+        'formatter',
+        'sleep_time',
+        'deadline',
+        '_templates'
+    )
+
+    def __init__(self, device, selection, response=True, format='auto',
+                 sleep_time=PACED, deadline=None):
+        self.device = device
+        self.path = tuple(selection)
+        self.prefix = bytes(' '.join([str(x) for x in selection]), 'utf-8')
+        self.returns = response
+        self.formatter = device.get_formatter(
+            response,
+            {'format': format},
+            self.path
+        )
+        self.sleep_time = sleep_time
+        self.deadline = deadline
+        # Format strings for the command, by number of arguments
+        self._templates = {}
+
+    def encode(self, *args):
+        if not args:
+            return self.prefix
+        template = self._templates.get(len(args))
+        if template is None:
+            base = self.prefix.decode('utf-8')
+            template = ' '.join(
+                [base.replace('{', '{{').replace('}', '}}')]
+                + ['{}'] * len(args)
+            )
+            self._templates[len(args)] = template
+        return template.format(*args).encode('utf-8')
+
+    def __call__(self, *args):
+        return self.device.send(
+            self.encode(*args),
+            self.returns,
+            self.formatter,
+            self.sleep_time,
+            self.deadline,
+            self.path
+        )
+
+    def __repr__(self):
+        return "<CompiledCommand '{}'/>".format(self.prefix.decode('utf-8'))
+
+
+class Batch(object):
+    """
+    A queue of commands for a device, see `Device.batch()`.
+
+    Each queued command returns a Future for its formatted response,
+    and `results` holds every response in order once flushed.
+    """
+    def __init__(self, device, window=16, separator=b'\n', sleep_time=PACED,
+                 deadline=None):
+        self.device = device
+        self.window = max(1, window)
+        self.separator = separator
+        self.sleep_time = sleep_time
+        self.deadline = deadline
+        self.queue = []
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.cancel()
+
+    def __getattr__(self, x):
+        if x.startswith('__'):
+            raise AttributeError(x)
+        return Command(self, (x,))
+
+    def __getitem__(self, x):
+        return Command(self, (x,))
+
+    def call(self, selection, args=(), **kwargs):
+        returns = kwargs.get('response', True)
+        command = bytes(
+            ' '.join([str(x) for x in selection + args]),
+            'utf-8'
+        )
+        future = concurrent.futures.Future()
+        self.queue.append((
+            command,
+            bool(returns),
+            self.device.get_formatter(returns, kwargs, selection),
+            future,
+            selection
+        ))
+        return future
+
+    def cancel(self):
+        for (_, _, _, future, _) in self.queue:
+            future.cancel()
+        self.queue = []
+
+    def _send(self, conn, queued, samples=None):
+        clock = time.perf_counter
+        start = clock()
+        Device._pace(conn, self.sleep_time)
+        slept = clock()
+        conn.write(self.separator.join(command for (command, *_) in queued))
+        written = clock()
+        pacing = getattr(conn, 'pacing', None)
+        if pacing is not None:
+            pacing.sent(any(returns for (_, returns, _, _, _) in queued))
+        for (command, returns, formatter, future, path) in queued:
+            read = clock()
+            if returns:
+                try:
+                    frame = conn.read_frame(deadline=self.deadline)
+                except (TimeoutError, OSError):
+                    if pacing is not None:
+                        pacing.failed()
+                    raise
+                received = clock()
+                data = formatter(frame)
+            else:
+                frame = None
+                received = clock()
+                data = None
+            if samples is not None:
+                samples.append(self._sample(
+                    command, path, frame, start, slept, written, read,
+                    received
+                ))
+                # The pause and write are counted once, on the first
+                start = slept = written
+            future.set_result(data)
+            self.results.append(data)
+        if pacing is not None:
+            pacing.received()
+
+    @staticmethod
+    def _sample(command, path, frame, start, slept, written, read, received):
+        """
+        The CommandSample of a batched command. Frames are read whole,
+        so the wait for each one after the previous is its first_byte.
+        """
+        from xtralien.metrics import (
+            CommandSample, command_path, response_bytes
+        )
+        sample = CommandSample(command_path(command, path))
+        sample.sleep = slept - start
+        sample.write = written - slept
+        sample.first_byte = received - read
+        sample.format = time.perf_counter() - received
+        sample.total = (
+            sample.sleep + sample.write + sample.first_byte + sample.format
+        )
+        sample.bytes_out = len(command)
+        sample.bytes_in = response_bytes(frame)
+        return sample
+
+    def flush(self):
+        """
+        Send every queued command, returning the list of results.
+        """
+        queue, self.queue = self.queue, []
+        device = self.device
+        for observer in (device.cache, device.mirror):
+            if observer is not None:
+                for (command, _, _, _, _) in queue:
+                    observer.observe(command)
+        metrics = device.metrics
+        samples = None if metrics is None else []
+        locking = time.perf_counter()
+        device.lock.acquire()
+        try:
+            device._check_streaming()
+            if samples is not None:
+                locked = time.perf_counter()
+            conn = device.connection
+            start = 0
+            waiting = 0
+            for (i, (_, returns, _, _, _)) in enumerate(queue):
+                if returns and i > start and not queue[i - 1][1]:
+                    # Let the write discard any reply to those without
+                    # a response before reading frames again
+                    self._send(conn, queue[start:i], samples)
+                    start = i
+                    waiting = 0
+                waiting += returns
+                if waiting == self.window:
+                    self._send(conn, queue[start:i + 1], samples)
+                    start = i + 1
+                    waiting = 0
+            if start < len(queue):
+                self._send(conn, queue[start:], samples)
+        except BaseException as e:
+            for (_, _, _, future, _) in queue:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        finally:
+            device.lock.release()
+        if samples:
+            samples[0].lock = locked - locking
+            samples[0].total += samples[0].lock
+            for sample in samples:
+                metrics.record(sample)
+        return self.results
 
 
 class Connection(object):
-    def __init__(self):
-        pass
+    def __init__(self, pacing=None):
+        _configure_logging()
+        # How long to wait before each command, see xtralien.pacing
+        self.pacing = AdaptivePacing() if pacing is None else pacing
+        # Counts reopens, so state known about the device can be dropped
+        self.opened = 0
 
     def read(self, *args, **kwargs):
         logging.error("Method not implemented (%s)" % self.read)
 
+    def read_frame(self, deadline=None):
+        return self.read(True, deadline=deadline)
+
+    def read_chunks(self, deadline=None):
+        yield bytes(self.read(True, deadline=deadline), 'utf-8')
+
+    def _check_deadline(self, expires, deadline):
+        """
+        Raise TimeoutError once `expires` (from `deadline` seconds) has
+        passed, otherwise return the seconds left, or None if there is
+        no deadline.
+        """
+        if expires is None:
+            return None
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(
+                "No response from {} within {}s".format(self, deadline)
+            )
+        return remaining
+
+    def wait(self, timeout=None):
+        """
+        Wait up to `timeout` seconds for a response to start arriving,
+        returning False if it hasn't.
+        """
+        return True
+
     def write(self, *args, **kwargs):
         logging.error("Method not implemented (%s)" % self.write)
 
@@ -376,35 +1343,176 @@ class Connection(object):
 
 
 class SocketConnection(Connection):
-    def __init__(self, host, port, timeout=0.07):
-        super(SocketConnection, self).__init__()
+    """
+    A TCP connection to a device.
+
+    Responses are framed by `terminator`, so a read returns as soon as
+    the end of the response has arrived. If the terminator never
+    arrives the read falls back to finishing after `timeout` seconds of
+    silence, which is also the only behaviour when `terminator` is None.
+    """
+    chunk_size = 576
+
+    def __init__(self, host, port, timeout=0.07, terminator=b'\n',
+                 pacing=None):
+        super(SocketConnection, self).__init__(pacing)
         self.host = host
         self.port = port
+        self.terminator = terminator
         self.socket = socket.socket()
         self.socket.connect((host, port))
         self.socket.settimeout(timeout)
+        # Reused between reads to avoid building up strings
+        self._buffer = bytearray()
+        self._chunk = memoryview(bytearray(self.chunk_size))
+
+    def _recv(self):
+        count = self.socket.recv_into(self._chunk)
+        if count == 0 and not self._buffer:
+            raise ConnectionError(
+                "Connection to {} closed".format(self)
+            )
+        self._buffer += self._chunk[:count]
+        return count
 
-    def read(self, wait=True):
-        retval = ""
-        if wait:
-            while retval == "":
+    def _pending(self):
+        return bool(select.select([self.socket], [], [], 0)[0])
+
+    def wait(self, timeout=None):
+        if self._buffer:
+            return True
+        return bool(select.select([self.socket], [], [], timeout)[0])
+
+    def _drain(self):
+        while self._pending() and self._recv():
+            continue
+
+    def read(self, wait=True, deadline=None):
+        """
+        Read a response, waiting for it to arrive if `wait` is set.
+
+        `deadline` is the number of seconds to wait for the response
+        before raising TimeoutError, None waits for ever.
+        """
+        buffer = self._buffer
+        terminator = self.terminator
+        expires = None
+        if wait and deadline is not None:
+            expires = time.monotonic() + deadline
+
+        if terminator is None:
+            while True:
+                try:
+                    if not self._recv():
+                        break
+                except socket.timeout:
+                    if wait and not buffer:
+                        self._check_deadline(expires, deadline)
+                        continue
+                    break
+        else:
+            while wait and not buffer.endswith(terminator):
                 try:
-                    retval = retval + str(self.socket.recv(576), 'utf-8')
+                    if not self._recv():
+                        break
                 except socket.timeout:
-                    continue
+                    if buffer:
+                        # The response was not terminated, assume it is done
+                        break
+                    self._check_deadline(expires, deadline)
+            # Pick up anything that arrived with the response
+            self._drain()
+
+        retval = buffer.decode('utf-8')
+        del buffer[:]
+        return retval
 
+    def read_chunks(self, deadline=None):
+        """
+        Yield a response in pieces as they arrive, without holding on
+        to the whole response.
+        """
+        buffer = self._buffer
+        terminator = self.terminator
+        expires = None
+        if deadline is not None:
+            expires = time.monotonic() + deadline
+
+        received = bool(buffer)
+        tail = b''
         while True:
             try:
-                retval = retval + str(self.socket.recv(576), 'utf-8')
+                count = self._recv()
             except socket.timeout:
+                if received:
+                    # The response was not terminated, assume it is done
+                    break
+                self._check_deadline(expires, deadline)
+                continue
+            data = bytes(buffer)
+            del buffer[:]
+            if data:
+                received = True
+                yield data
+            if not count:
                 break
+            if terminator is not None:
+                tail = (tail + data)[-len(terminator):]
+                if tail == terminator:
+                    break
 
+    def read_frame(self, deadline=None):
+        """
+        Read exactly one terminated response, leaving anything that
+        follows it buffered for the next read. As with `read`, a
+        response that isn't terminated ends after `timeout` seconds of
+        silence.
+        """
+        if self.terminator is None:
+            return self.read(True, deadline=deadline)
+
+        buffer = self._buffer
+        terminator = self.terminator
+        expires = None
+        if deadline is not None:
+            expires = time.monotonic() + deadline
+
+        start = 0
+        end = buffer.find(terminator)
+        while end < 0:
+            start = max(0, len(buffer) - len(terminator) + 1)
+            try:
+                count = self._recv()
+            except socket.timeout:
+                if buffer:
+                    # The response was not terminated, assume it is done
+                    end = len(buffer) - len(terminator)
+                    break
+                self._check_deadline(expires, deadline)
+                continue
+            if not count:
+                raise ConnectionError(
+                    "Connection to {} closed".format(self)
+                )
+            end = buffer.find(terminator, start)
+
+        end += len(terminator)
+        retval = buffer[:end].decode('utf-8')
+        del buffer[:end]
         return retval
 
     def write(self, cmd):
         if type(cmd) == str:
             cmd = bytes(cmd, 'utf-8')
-        self.socket.send(cmd)
+        if self.terminator is not None:
+            self._drain()
+        if self._buffer:
+            # Anything still waiting is left over from a previous command
+            logger.debug(
+                "Discarding stale data from %s: %r", self, bytes(self._buffer)
+            )
+            del self._buffer[:]
+        self.socket.sendall(cmd)
 
     def close(self):
         self.socket.close()
@@ -416,37 +1524,186 @@ class SocketConnection(Connection):
         )
 
 
+def _serial():
+    serial = _import_optional('serial')
+    if serial is None:
+        raise ImportError("USB connections need the serial module (pyserial)")
+    return serial
+
+
 class SerialConnection(Connection):
-    def __init__(self, port, timeout=0.1):
-        super(SerialConnection, self).__init__()
+    """
+    A USB-serial connection to a device.
+
+    Reads block on the port rather than polling it. A response is
+    complete when `terminator` arrives or, failing that, after `timeout`
+    seconds without any new data.
+    """
+    def __init__(self, port, timeout=0.1, terminator=b'\n', pacing=None):
+        super(SerialConnection, self).__init__(pacing)
         self.port = port
-        self.connection = serial.Serial(port, timeout=timeout)
+        self.timeout = timeout
+        self.terminator = terminator
+        self.connection = _serial().Serial(port, timeout=timeout)
+        self._buffer = bytearray()
+        try:
+            self._fileno = self.connection.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            self._fileno = None
+
+    def _fill(self, timeout):
+        """
+        Wait up to `timeout` seconds (None for ever) for data and add
+        it to the buffer, returning the number of bytes read.
+        """
+        conn = self.connection
+        if self._fileno is not None:
+            if not select.select([self._fileno], [], [], timeout)[0]:
+                return 0
+            data = conn.read(conn.in_waiting or 1)
+        elif timeout == 0:
+            data = conn.read(conn.in_waiting)
+        else:
+            # No selectable handle (Windows), block in a read instead
+            data = conn.read(1)
+            if data:
+                data += conn.read(conn.in_waiting)
+        self._buffer += data
+        return len(data)
+
+    def wait(self, timeout=None):
+        if self._buffer or self._fileno is None:
+            return True
+        return bool(select.select([self._fileno], [], [], timeout)[0])
+
+    def read(self, wait=True, deadline=None):
+        """
+        Read a response, waiting for it to arrive if `wait` is set.
+
+        `deadline` is the number of seconds to wait for the response
+        before raising TimeoutError, None waits for ever.
+        """
+        buffer = self._buffer
+        terminator = self.terminator
 
-    def read(self, wait=True):
-        retval = ""
+        if wait:
+            expires = None
+            if deadline is not None:
+                expires = time.monotonic() + deadline
+
+            while not buffer:
+                self._fill(self._check_deadline(expires, deadline))
+
+            while terminator is None or not buffer.endswith(terminator):
+                gap = self.timeout
+                if expires is not None:
+                    gap = max(0, min(gap, expires - time.monotonic()))
+                if not self._fill(gap):
+                    break
 
-        while wait and (self.connection.inWaiting() == 0):
+        # Pick up anything that arrived with the response
+        while self._fill(0):
             continue
 
-        while self.connection.inWaiting() > 0:
-            try:
-                retval = retval + str(
-                    self.connection.read(
-                        self.connection.inWaiting()
-                    ),
-                    'utf-8'
-                )
-            except Exception:
+        retval = buffer.decode('utf-8')
+        del buffer[:]
+        return retval
+
+    def read_chunks(self, deadline=None):
+        """
+        Yield a response in pieces as they arrive, without holding on
+        to the whole response.
+        """
+        buffer = self._buffer
+        terminator = self.terminator
+        expires = None
+        if deadline is not None:
+            expires = time.monotonic() + deadline
+
+        received = False
+        tail = b''
+        while True:
+            if received:
+                gap = self.timeout
+            else:
+                gap = self._check_deadline(expires, deadline)
+            if not self._fill(gap) and received:
+                # The response was not terminated, assume it is done
                 break
+            data = bytes(buffer)
+            del buffer[:]
+            if data:
+                received = True
+                yield data
+                if terminator is not None:
+                    tail = (tail + data)[-len(terminator):]
+                    if tail == terminator:
+                        break
+
+    def reopen(self):
+        """
+        Open the port again, e.g. after the device was unplugged.
+        """
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = _serial().Serial(self.port, timeout=self.timeout)
+        self.opened += 1
+        del self._buffer[:]
+        try:
+            self._fileno = self.connection.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            self._fileno = None
+
+    def read_frame(self, deadline=None):
+        """
+        Read exactly one terminated response, leaving anything that
+        follows it buffered for the next read. As with `read`, a
+        response that isn't terminated ends after `timeout` seconds of
+        silence.
+        """
+        if self.terminator is None:
+            return self.read(True, deadline=deadline)
+
+        buffer = self._buffer
+        terminator = self.terminator
+        expires = None
+        if deadline is not None:
+            expires = time.monotonic() + deadline
+
+        start = 0
+        end = buffer.find(terminator)
+        while end < 0:
+            start = max(0, len(buffer) - len(terminator) + 1)
+            if buffer:
+                if not self._fill(self.timeout):
+                    # The response was not terminated, assume it is done
+                    end = len(buffer) - len(terminator)
+                    break
+            else:
+                self._fill(self._check_deadline(expires, deadline))
+            end = buffer.find(terminator, start)
 
+        end += len(terminator)
+        retval = buffer[:end].decode('utf-8')
+        del buffer[:end]
         return retval
 
     def write(self, cmd):
         if type(cmd) == str:
             cmd = bytes(cmd, 'utf-8')
-        self.connection.write(cmd)
-        while self.connection.out_waiting > 0:
+        while self._fill(0):
             continue
+        if self._buffer:
+            # Anything still waiting is left over from a previous command
+            logger.debug(
+                "Discarding stale data from %s: %r", self, bytes(self._buffer)
+            )
+            del self._buffer[:]
+        self.connection.write(cmd)
+        # Blocks until the data has been transmitted
+        self.connection.flush()
 
     def close(self):
         self.connection.close()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio support for Xtralien devices.
+
+AsyncDevice uses the same command syntax as Device, but calling a
+command returns an awaitable, so one event loop can keep commands in
+flight on many devices at once.
+
+    dev = await AsyncDevice.Network('192.168.0.10')
+    voltage, current = (await dev.smu1.oneshot(1.0))[0]
+"""
+import asyncio
+import functools
+
+from xtralien import (
+    Command,
+    PACED,
+    AdaptivePacing,
+    Device,
+    ResponseParser,
+    SerialConnection,
+    broadcast_addresses,
+    logger,
+    process_auto
+)
+from xtralien.watcher import DeviceWatcher
+
+
+def _identity(x):
+    return x
+
+
+class AsyncSocketConnection(object):
+    """
+    A TCP connection to a device using asyncio streams.
+
+    Responses are framed in the same way as SocketConnection.
+    """
+    chunk_size = 576
+
+    def __init__(self, reader, writer, host, port, timeout=0.07,
+                 terminator=b'\n', pacing=None):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.terminator = terminator
+        self.pacing = AdaptivePacing() if pacing is None else pacing
+        self._buffer = bytearray()
+
+    @staticmethod
+    async def open(host, port, *args, **kwargs):
+        reader, writer = await asyncio.open_connection(host, port)
+        return AsyncSocketConnection(reader, writer, host, port, *args, **kwargs)
+
+    async def _recv(self, timeout):
+        data = await asyncio.wait_for(
+            self.reader.read(self.chunk_size),
+            timeout
+        )
+        if not data and not self._buffer:
+            raise ConnectionError("Connection to {} closed".format(self))
+        self._buffer += data
+        return len(data)
+
+    async def read(self, wait=True, deadline=None):
+        buffer = self._buffer
+        terminator = self.terminator
+
+        if wait:
+            try:
+                await self._recv(deadline)
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    "No response from {} within {}s".format(self, deadline)
+                )
+            while terminator is None or not buffer.endswith(terminator):
+                try:
+                    if not await self._recv(self.timeout):
+                        break
+                except asyncio.TimeoutError:
+                    break
+
+        retval = buffer.decode('utf-8')
+        del buffer[:]
+        return retval
+
+    async def _drain(self):
+        # Give the loop a chance to receive whatever has arrived, then
+        # read until a read would have to wait for more
+        await asyncio.sleep(0)
+        while True:
+            read = asyncio.ensure_future(self.reader.read(self.chunk_size))
+            await asyncio.sleep(0)
+            if not read.done():
+                # Nothing was waiting, cancelling the read loses nothing
+                read.cancel()
+                try:
+                    await read
+                except asyncio.CancelledError:
+                    pass
+                return
+            data = read.result()
+            if not data:
+                return
+            self._buffer += data
+
+    async def write(self, cmd):
+        if type(cmd) == str:
+            cmd = bytes(cmd, 'utf-8')
+        await self._drain()
+        if self._buffer:
+            # Anything still waiting is left over from a previous command
+            logger.debug(
+                "Discarding stale data from %s: %r", self, bytes(self._buffer)
+            )
+            del self._buffer[:]
+        self.writer.write(cmd)
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.close()
+
+    def __repr__(self):
+        return "<AsyncSocket {host}:{port} />".format(
+            host=self.host,
+            port=self.port
+        )
+
+
+class AsyncSerialConnection(object):
+    """
+    Runs a SerialConnection in the event loop's executor.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    @property
+    def pacing(self):
+        return self.connection.pacing
+
+    @staticmethod
+    async def open(port, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        connection = await loop.run_in_executor(
+            None,
+            lambda: SerialConnection(port, *args, **kwargs)
+        )
+        return AsyncSerialConnection(connection)
+
+    async def read(self, wait=True, deadline=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            lambda: self.connection.read(wait, deadline=deadline)
+        )
+
+    async def write(self, cmd):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.connection.write, cmd)
+
+    async def close(self):
+        self.connection.close()
+
+    def __repr__(self):
+        return "<AsyncSerial/USB {connection} />".format(
+            connection=self.connection.port
+        )
+
+
+class AsyncDevice(object):
+    """
+    An asyncio version of Device.
+
+    Commands on a single device are sent one at a time, while commands
+    to different devices run concurrently.
+    """
+    formatters = Device.formatters
+
+    def __init__(self, connection=None):
+        self.connections = []
+        self.parser = ResponseParser()
+        self._lock = None
+
+        if connection is not None:
+            self.add_connection(connection)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __getattr__(self, x):
+        if x.startswith('__'):
+            raise AttributeError(x)
+        return Command(self, (x,))
+
+    def __getitem__(self, x):
+        return Command(self, (x,))
+
+    @property
+    def connection(self):
+        return self.connections[0]
+
+    @property
+    def lock(self):
+        # Created on first use so that it belongs to the running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def add_connection(self, connection):
+        self.connections.append(connection)
+
+    async def command(self, command, returns=False, sleep_time=PACED,
+                      deadline=None):
+        if self.connections == []:
+            logger.error(
+                "Can't send command '{cmd}'\
+                because there are no open connections'".format(
+                    cmd=command
+                )
+            )
+            return None
+        conn = self.connection
+        async with self.lock:
+            if sleep_time is PACED:
+                sleep_time = conn.pacing.wait_time()
+            if sleep_time:
+                await asyncio.sleep(sleep_time)
+            await conn.write(command)
+            conn.pacing.sent(returns)
+            try:
+                response = await conn.read(returns, deadline=deadline)
+            except (TimeoutError, OSError):
+                conn.pacing.failed()
+                raise
+            conn.pacing.received()
+            return response
+
+    async def call(self, selection, args=(), **kwargs):
+        returns = kwargs.get('response', True)
+        command = ' '.join([str(x) for x in selection + args])
+
+        formatter = _identity
+        if returns:
+            formatter = self.formatters.get(
+                kwargs.get('format', 'auto'),
+                _identity
+            )
+            if formatter is process_auto:
+                formatter = functools.partial(self.parser.parse, path=selection)
+
+        return formatter(await self.command(
+            command,
+            returns=returns,
+            sleep_time=kwargs.get('sleep_time', PACED),
+            deadline=kwargs.get('deadline', None)
+        ))
+
+    def __call__(self, *args, **kwargs):
+        return self.call((), args, **kwargs)
+
+    async def close(self):
+        for conn in self.connections:
+            await conn.close()
+
+    def __repr__(self):
+        if len(self.connections):
+            return "<AsyncDevice connection={connection}/>".format(
+                connection=self.connections[0]
+            )
+        else:
+            return "<AsyncDevice connection=None/>"
+
+    @staticmethod
+    async def discover(broadcast_address=None, timeout=0.1, *args, **kwargs):
+        """
+        Find devices on the network and connect to them concurrently.
+        """
+        addresses = await discover_addresses(broadcast_address, timeout)
+        return list(await asyncio.gather(*[
+            AsyncDevice.Network(addr, *args, **kwargs) for addr in addresses
+        ]))
+
+    @staticmethod
+    async def USB(com=None, serial_timeout=0.1):
+        if com is None:
+            loop = asyncio.get_running_loop()
+            with DeviceWatcher() as watcher:
+                com = await loop.run_in_executor(None, watcher.wait_for_device)
+
+        return AsyncDevice(
+            await AsyncSerialConnection.open(com, timeout=serial_timeout)
+        )
+
+    fromUSB = USB
+    openUSB = USB
+
+    @staticmethod
+    async def COM(com, *args, **kwargs):
+        return await AsyncDevice.USB("COM{}".format(com), *args, **kwargs)
+
+    fromCOM = COM
+    openCOM = COM
+
+    @staticmethod
+    async def Network(ip, *args, **kwargs):
+        return AsyncDevice(
+            await AsyncSocketConnection.open(ip, 8888, *args, **kwargs)
+        )
+
+    fromNetwork = Network
+    openNetwork = Network
+
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.addresses = []
+        self.received = asyncio.Event()
+
+    def datagram_received(self, data, addr):
+        if addr[0] not in self.addresses:
+            self.addresses.append(addr[0])
+        self.received.set()
+
+
+async def discover_addresses(broadcast_address=None, timeout=0.1):
+    """
+    Broadcast a discovery request to every interface and return the
+    addresses that reply, waiting until no replies arrive for `timeout`
+    seconds.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        _DiscoveryProtocol,
+        local_addr=('0.0.0.0', 0),
+        allow_broadcast=True
+    )
+    if broadcast_address is None:
+        addresses = broadcast_addresses()
+    else:
+        addresses = [broadcast_address]
+    try:
+        for address in addresses:
+            try:
+                transport.sendto(b"xtra", (address, 8889))
+            except OSError as e:
+                logger.debug("Can't send discovery to %s: %s", address, e)
+        while True:
+            try:
+                await asyncio.wait_for(protocol.received.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+            protocol.received.clear()
+    finally:
+        transport.close()
+    return protocol.addresses
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caching of responses to queries that don't change between calls.
+
+    cache = dev.cache_responses(ttl=5.0)
+    dev.smu1.get.range()  # asks the device
+    dev.smu1.get.range()  # answered from the cache
+    dev.smu1.set.range(2, response=0)  # forgets everything about smu1
+
+Only commands containing 'get', and those given a TTL in `ttls`, are
+cached. Commands that might change settings remove the cached
+responses of their module (their first word) when they go through the
+same device, see `invalidated_path`, so a cached value can't outlive a
+change made through the library. Changes made some other way are only
+picked up once the TTL expires.
+
+Cached responses are shared between callers, so arrays they return
+shouldn't be modified in place.
+"""
+import collections
+import threading
+import time
+
+# The serial number only changes through `Device.serial`, which
+# invalidates it, so it is kept until then
+DEFAULT_TTLS = {'serial': None}
+
+
+def _is_number(word):
+    try:
+        float(word)
+    except ValueError:
+        return False
+    return True
+
+
+def invalidated_path(words):
+    """
+    The path whose state a command might change, or None.
+
+    'reset' on its own changes everything, and a set, a reset or a
+    command with numeric arguments that isn't a get changes its module:
+    'smu1 measurev' is harmless, 'smu1 oneshot 1.0' isn't.
+    """
+    if not words:
+        return None
+    if 'reset' in words:
+        return () if words[0] == 'reset' else tuple(words[:1])
+    if 'set' in words:
+        return tuple(words[:1])
+    if 'get' not in words and any(_is_number(w) for w in words[1:]):
+        return tuple(words[:1])
+    return None
+
+
+def _words(path):
+    if isinstance(path, str):
+        return tuple(path.split())
+    return tuple(str(x) for x in path)
+
+
+class ResponseCache(object):
+    """
+    An LRU cache of up to `maxsize` formatted responses, each kept for
+    `ttl` seconds (None keeps them until invalidated).
+
+    `ttls` maps command paths, such as 'serial' or 'smu1 get range', to
+    their own TTL, on top of DEFAULT_TTLS; a TTL of 0 disables caching
+    for that path.
+    """
+    def __init__(self, ttl=1.0, maxsize=256, ttls=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.ttls = {
+            _words(path): value
+            for (path, value) in dict(DEFAULT_TTLS, **(ttls or {})).items()
+        }
+        self.hits = 0
+        self.misses = 0
+        # Changes on every invalidation, see `put`
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl_for(self, words):
+        """
+        The TTL for a command, or False if it isn't cached.
+        """
+        for size in range(len(words), 0, -1):
+            ttl = self.ttls.get(words[:size], False)
+            if ttl is not False:
+                return False if ttl == 0 else ttl
+        if 'get' in words:
+            return self.ttl
+        return False
+
+    def get(self, key):
+        """
+        Return (True, response) for a cached response that hasn't
+        expired, otherwise (False, None).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                (expires, value) = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return (True, value)
+                del self._entries[key]
+            self.misses += 1
+            return (False, None)
+
+    def put(self, key, value, ttl, generation=None):
+        """
+        Cache a response. If `generation` is given, the response is only
+        kept if nothing was invalidated since `generation` was read, as
+        the response might predate the change.
+        """
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path=()):
+        """
+        Forget the responses to commands starting with `path`, or
+        everything if it is empty.
+        """
+        prefix = _words(path)
+        with self._lock:
+            self.generation += 1
+            if not prefix:
+                self._entries.clear()
+                return
+            for key in [
+                key for key in self._entries
+                if key[0][:len(prefix)] == prefix
+            ]:
+                del self._entries[key]
+
+    def observe(self, command):
+        """
+        Invalidate the module of a command that is about to be sent if
+        it changes settings.
+        """
+        if type(command) == bytes:
+            command = command.decode('utf-8')
+        path = invalidated_path(command.split())
+        if path is not None:
+            self.invalidate(path)
+
+    def clear(self):
+        self.invalidate()
+
+    def __repr__(self):
+        return "<ResponseCache entries={} hits={} misses={}/>".format(
+            len(self._entries), self.hits, self.misses
+        )
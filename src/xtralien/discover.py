@@ -12,8 +12,8 @@ def main():
     Attempt to discover all devices on the network and print any
     found.
     """
-    for dev in xtralien.Device.discover(timeout=1.0):
-        print(dev.connections[0].host)
+    for info in xtralien.Device.scan(timeout=1.0, refresh=True):
+        print(info.host)
 
 
 if __name__ == "__main__":
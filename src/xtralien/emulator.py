@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+An emulated Xtralien device, for testing and benchmarking without
+hardware.
+
+    with Emulator(port=0, latency=0.001) as emulator:
+        dev = Device('127.0.0.1', emulator.port)
+        dev.smu1.set.voltage(1.0, response=0)
+        print(dev.smu1.oneshot())
+
+The emulator answers CLOI commands over TCP (8888 by default), replies
+to discovery requests over UDP (8889) and can serve a pseudo-terminal
+that SerialConnection opens like a USB port. Responses are made up:
+
+- commands containing 'set' store their arguments and don't respond
+- the same command with 'get' returns the stored value
+- 'oneshot' returns a one row matrix of voltage and current
+- 'sweep' returns a matrix of `matrix_rows` rows
+- 'array' returns an array of `array_size` values
+- anything else returns a number
+
+It can also be run on its own:
+
+    python -m xtralien.emulator --latency 0.001 --pty
+"""
+import argparse
+import os
+import random
+import select
+import socket
+import threading
+import time
+
+from xtralien import logger
+
+# Error injection modes
+DROP = 'drop'
+ERROR = 'error'
+TRUNCATE = 'truncate'
+
+
+def format_number(value):
+    return '{!r}\n'.format(float(value))
+
+
+def format_array(values):
+    return '[{}]\n'.format(';'.join(repr(float(v)) for v in values))
+
+
+def format_matrix(rows):
+    return '[{}]\n'.format(';'.join(
+        ','.join(repr(float(v)) for v in row) for row in rows
+    ))
+
+
+class Emulator(object):
+    """
+    Emulates a device for any number of TCP clients and an optional
+    pty.
+
+    Every response is delayed by `latency` seconds, give or take up to
+    `jitter` seconds. A fraction `error_rate` of commands fail in one
+    of the `errors` modes: DROP sends nothing, ERROR sends an error
+    message and TRUNCATE sends part of the response without its
+    terminator.
+
+    `responses` maps commands (such as 'smu1 measurev') to a response
+    string or a function of the command's arguments returning one.
+    """
+    def __init__(self, host='127.0.0.1', port=8888, discovery_port=8889,
+                 latency=0.0, jitter=0.0, error_rate=0.0,
+                 errors=(DROP, ERROR, TRUNCATE), array_size=100,
+                 matrix_rows=100, responses=None, seed=None):
+        self.host = host
+        self.port = port
+        self.discovery_port = discovery_port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = errors
+        self.array_size = array_size
+        self.matrix_rows = matrix_rows
+        self.responses = dict(responses or {})
+        self.state = {}
+        self.commands = 0
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sockets = []
+        self._threads = []
+        self._pty = None
+        # Written to wake up the pty thread when closing
+        (self._wake_r, self._wake_w) = socket.socketpair()
+        self._stopped = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def respond(self, command):
+        """
+        The response to a single command, or None for no response.
+        """
+        with self._lock:
+            self.commands += 1
+            failure = (
+                self.error_rate and
+                self.random.random() < self.error_rate and
+                self.random.choice(self.errors)
+            )
+            delay = self.latency
+            if self.jitter:
+                delay += self.random.uniform(-self.jitter, self.jitter)
+
+        if delay > 0:
+            time.sleep(delay)
+        if failure == DROP:
+            return None
+
+        words = command.split()
+        response = self.handle(words)
+        if failure == ERROR:
+            return 'Error: {}\n'.format(command)
+        if failure == TRUNCATE and response:
+            return response[:max(1, len(response) // 2)].rstrip('\n')
+        return response
+
+    def handle(self, words):
+        if not words:
+            return None
+        for size in range(len(words), 0, -1):
+            response = self.responses.get(' '.join(words[:size]))
+            if response is not None:
+                if callable(response):
+                    return response(*words[size:])
+                return response
+
+        if 'set' in words:
+            i = words.index('set')
+            key = tuple(words[:i] + words[i + 1:-1])
+            self.state[key] = words[-1] if len(words) > i + 2 else None
+            return None
+        if 'get' in words:
+            i = words.index('get')
+            key = tuple(words[:i] + words[i + 1:])
+            return '{}\n'.format(self.state.get(key, 0))
+
+        if 'oneshot' in words:
+            return format_matrix([self._point()])
+        if 'sweep' in words:
+            return format_matrix(self._point() for _ in range(self.matrix_rows))
+        if 'array' in words:
+            return format_array(
+                self.random.random() for _ in range(self.array_size)
+            )
+        return format_number(self.random.random())
+
+    def _point(self):
+        voltage = self.random.uniform(-10, 10)
+        return (voltage, voltage / 1000.0)
+
+    def _serve_stream(self, recv, send):
+        """
+        Answer commands until `recv` returns nothing. Like the device,
+        each read holds one command or several separated by newlines.
+        """
+        while not self._stopped:
+            try:
+                data = recv()
+            except OSError:
+                break
+            if not data:
+                break
+            for line in data.split(b'\n'):
+                if not line.strip():
+                    continue
+                response = self.respond(line.decode('utf-8', 'replace'))
+                if response:
+                    try:
+                        send(response.encode('utf-8'))
+                    except OSError:
+                        return
+
+    def _serve_client(self, client):
+        with client:
+            self._serve_stream(lambda: client.recv(4096), client.sendall)
+
+    def _accept(self, server):
+        while not self._stopped:
+            try:
+                (client, _) = server.accept()
+            except OSError:
+                break
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sockets.append(client)
+            self._spawn(self._serve_client, client)
+
+    def _discovery(self, udp):
+        while not self._stopped:
+            try:
+                (_, addr) = udp.recvfrom(64)
+                if self._stopped or addr is None:
+                    break
+                udp.sendto(b'xtra', addr)
+            except OSError:
+                break
+
+    def _serve_pty(self, master):
+        def recv():
+            ready = select.select([master, self._wake_r], [], [])[0]
+            if self._wake_r in ready:
+                return b''
+            return os.read(master, 4096)
+
+        def send(data):
+            os.write(master, data)
+
+        self._serve_stream(recv, send)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(
+            target=target,
+            args=args,
+            name='xtralien-emulator',
+            daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def start(self):
+        """
+        Start listening for TCP connections and discovery requests.
+        Either is skipped if its port is None; a port of 0 picks a free
+        port, which is then stored in `port` or `discovery_port`.
+        """
+        if self.port is not None:
+            server = socket.socket()
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, self.port))
+            server.listen(16)
+            self.port = server.getsockname()[1]
+            self._sockets.append(server)
+            self._spawn(self._accept, server)
+
+        if self.discovery_port is not None:
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            udp.bind(('', self.discovery_port))
+            self.discovery_port = udp.getsockname()[1]
+            self._sockets.append(udp)
+            self._spawn(self._discovery, udp)
+
+    def open_pty(self):
+        """
+        Serve a pseudo-terminal as well, returning the path to open
+        with SerialConnection.
+        """
+        (master, slave) = os.openpty()
+        self._pty = (master, slave)
+        self._spawn(self._serve_pty, master)
+        return os.ttyname(slave)
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wake_w.send(b'x')
+        for sock in self._sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(1.0)
+        if self._pty is not None:
+            for fd in self._pty:
+                os.close(fd)
+            self._pty = None
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def __repr__(self):
+        return "<Emulator {}:{} commands={}/>".format(
+            self.host, self.port, self.commands
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--discovery-port', type=int, default=8889)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--array-size', type=int, default=100)
+    parser.add_argument('--matrix-rows', type=int, default=100)
+    parser.add_argument('--pty', action='store_true')
+    args = parser.parse_args()
+
+    emulator = Emulator(
+        host=args.host,
+        port=args.port,
+        discovery_port=args.discovery_port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        array_size=args.array_size,
+        matrix_rows=args.matrix_rows
+    )
+    with emulator:
+        print("Listening on {}:{}".format(emulator.host, emulator.port))
+        if args.pty:
+            print("Serial port {}".format(emulator.open_pty()))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    logger.info("Answered %d commands", emulator.commands)
+
+
+if __name__ == '__main__':
+    main()
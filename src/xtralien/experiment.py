@@ -1,15 +1,538 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Experiments sample a set of channels while they run.
+
+    channels = {'smu1': dev.smu1.measurev, 'smu2': dev.smu2.measurev}
+    with Experiment('stability', devices=channels, frequency=10) as exp:
+        time.sleep(3600)
+    print(exp.stats)
+
+In MONITOR mode every channel is sampled at `frequency` Hz into a
+ring buffer, with the first column holding the time of each sample.
+
+In TRIGGER mode sampling runs in the same way, and when the trigger
+fires the `pre` samples before it and `post` samples after it are
+captured:
+
+    trigger = ThresholdTrigger('smu1', 0.5)
+    with Experiment(mode=TRIGGER, devices=channels, frequency=1000,
+                    trigger=trigger, pre=100, post=900) as exp:
+        window = exp.wait(timeout=60)
+
+Experiments given a `store` path also append their samples to a
+ResultStore while running, so long runs aren't limited by the size of
+the buffer and survive a crash. Nothing is written unless a store is
+given, and an existing store is carried on from where it left off.
+"""
+import math
+import queue
+import threading
+import time
+
+import numpy
+
+from xtralien import logger
+from xtralien.storage import ResultStore
+
 MONITOR = 0b001
 TRIGGER = 0b010
 
 
+class RingBuffer(object):
+    """
+    A preallocated array of rows that overwrites the oldest rows once
+    it is full.
+    """
+    def __init__(self, capacity, width):
+        self.data = numpy.full((capacity, width), numpy.nan)
+        self.capacity = capacity
+        # Total number of rows ever appended
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, row):
+        self.data[self.count % self.capacity] = row
+        self.count += 1
+
+    def last(self, n=None):
+        """
+        A copy of the last `n` rows (all of them by default), oldest
+        first.
+        """
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self.count % self.capacity
+        start = end - n
+        if start >= 0:
+            return self.data[start:end].copy()
+        return numpy.concatenate((self.data[start:], self.data[:end]))
+
+    def values(self):
+        return self.last()
+
+
+RISING = 1
+FALLING = -1
+EITHER = 0
+
+
+class Trigger(object):
+    """
+    The base trigger, which fires when `fire()` is called.
+
+    Triggers that depend on the samples themselves implement `check()`,
+    which is called with the previous and latest rows.
+    """
+    def __init__(self):
+        self._callback = None
+
+    def attach(self, callback):
+        self._callback = callback
+
+    def detach(self):
+        self._callback = None
+
+    def fire(self):
+        callback = self._callback
+        if callback is not None:
+            callback(time.perf_counter())
+
+    def check(self, columns, previous, row):
+        return False
+
+
+class SoftwareTrigger(Trigger):
+    """
+    A trigger that is fired by calling `fire()`, e.g. from another
+    thread.
+    """
+
+
+def _crossed(before, after, level, direction):
+    if direction >= 0 and before < level <= after:
+        return True
+    if direction <= 0 and before > level >= after:
+        return True
+    return False
+
+
+class ThresholdTrigger(Trigger):
+    """
+    Fires when the `column` of the samples crosses `level` in the
+    given direction (RISING, FALLING or EITHER).
+    """
+    def __init__(self, column, level, direction=RISING):
+        super(ThresholdTrigger, self).__init__()
+        self.column = column
+        self.level = level
+        self.direction = direction
+
+    def check(self, columns, previous, row):
+        if previous is None:
+            return False
+        index = columns.index(self.column)
+        return _crossed(previous[index], row[index], self.level, self.direction)
+
+
+class PinTrigger(Trigger):
+    """
+    Fires when the value returned by `read` changes, such as a
+    SmartBoard input pin:
+
+        PinTrigger(dev.smartio.get.value.pin[3], edge=RISING)
+
+    CLOI has no pin interrupts, so the pin is read every
+    `poll_interval` seconds from a thread of its own, which sleeps in
+    between rather than spinning.
+    """
+    def __init__(self, read, edge=EITHER, poll_interval=0.001):
+        super(PinTrigger, self).__init__()
+        self.read = read
+        self.edge = edge
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, callback):
+        super(PinTrigger, self).attach(callback)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll,
+            name='xtralien-pin-trigger',
+            daemon=True
+        )
+        self._thread.start()
+
+    def detach(self):
+        super(PinTrigger, self).detach()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self):
+        last = None
+        while not self._stop.wait(self.poll_interval):
+            try:
+                value = float(self.read())
+            except Exception as e:
+                logger.warning("Reading trigger pin failed: %s", e)
+                continue
+            if last is not None and value != last and (
+                self.edge == EITHER or
+                (self.edge == RISING) == (value > last)
+            ):
+                self.fire()
+            last = value
+
+
 class Experiment(object):
-    def __init__(self, name=None, description=None, mode=MONITOR, frequency=1, devices=None):
+    """
+    Samples `devices`, a dict of names to callables (such as
+    `dev.smu1.measurev`) or a list of callables, while running.
+    """
+    def __init__(self, name=None, description=None, mode=MONITOR, frequency=1,
+                 devices=None, capacity=100000, trigger=None, pre=0, post=1,
+                 rearm=False, store=None, flush_interval=1.0):
+        self.name = name
+        self.description = description
         self.devices = devices
         self.frequency = frequency
         self.mode = mode
+        self.trigger = trigger
+        self.pre = pre
+        self.post = max(1, post)
+        self.rearm = rearm
+        # The buffer has to hold a whole capture
+        self.capacity = max(capacity, pre + self.post)
+        self.captures = []
+        self.store = store
+        self.flush_interval = flush_interval
+
+        if isinstance(devices, dict):
+            self.channels = list(devices.items())
+        else:
+            self.channels = [
+                (str(i), device) for (i, device) in enumerate(devices or [])
+            ]
+
+        self.buffer = None
+        self.columns = None
+        self.started_at = None
+        self._started = None
+        self._stop = threading.Event()
+        # Set to wake the sampler early, when stopping or triggered
+        self._wake = threading.Event()
+        self._thread = None
+        self._captured = threading.Condition()
+        self._armed = False
+        self._fired_at = None
+        self._capture_from = None
+        self._previous = None
+        # Rows of the buffer already queued for the store
+        self._stored = 0
+        self._stored_at = 0.0
+        # Rows waiting to be appended to the store by `_writer`, so the
+        # sampler never waits for the disk
+        self._pending = queue.Queue()
+        self._writer = None
+        self._reset_stats()
 
     def __enter__(self):
-        pass
+        self.start()
+        return self
 
     def __exit__(self, *args):
+        self.stop()
         self.save()
+
+    def _reset_stats(self):
+        self.samples = 0
+        self.missed = 0
+        self.errors = 0
+        self._lateness_sum = 0.0
+        self._lateness_squares = 0.0
+        self._lateness_max = 0.0
+        self.trigger_latency = []
+
+    @property
+    def stats(self):
+        """
+        Sampling statistics. Jitter is how late each sample started
+        compared to its schedule, in seconds.
+        """
+        n = self.samples
+        mean = self._lateness_sum / n if n else 0.0
+        variance = self._lateness_squares / n - mean ** 2 if n else 0.0
+        return {
+            'samples': n,
+            'missed': self.missed,
+            'errors': self.errors,
+            'jitter_mean': mean,
+            'jitter_std': math.sqrt(max(0.0, variance)),
+            'jitter_max': self._lateness_max,
+            'triggers': len(self.trigger_latency),
+            'trigger_latency_max': max(self.trigger_latency, default=0.0),
+        }
+
+    def sample(self):
+        """
+        Read every channel once, returning a flat array of values.
+        """
+        values = []
+        for (name, channel) in self.channels:
+            try:
+                values.append(numpy.ravel(numpy.asarray(channel(), float)))
+            except Exception as e:
+                logger.warning("Reading %s failed: %s", name, e)
+                self.errors += 1
+                values.append(None)
+
+        if self.columns is None:
+            self._allocate(values)
+        width = len(self.columns) - 1
+        if any(v is None for v in values) or sum(map(len, values)) != width:
+            return numpy.full(width, numpy.nan)
+        return numpy.concatenate(values) if values else numpy.empty(0)
+
+    def _allocate(self, values):
+        columns = ['time']
+        for ((name, _), value) in zip(self.channels, values):
+            size = 1 if value is None else len(value)
+            if size == 1:
+                columns.append(name)
+            else:
+                columns += ['{}[{}]'.format(name, i) for i in range(size)]
+        self.columns = columns
+        self.buffer = RingBuffer(self.capacity, len(columns))
+        if self.store is not None and not isinstance(self.store, ResultStore):
+            self.store = ResultStore(self.store, columns=columns)
+
+    def _record(self, timestamp, lateness):
+        values = self.sample()
+        row = numpy.concatenate(([timestamp], values))
+        self.buffer.append(row)
+        self.samples += 1
+        self._lateness_sum += lateness
+        self._lateness_squares += lateness * lateness
+        self._lateness_max = max(self._lateness_max, lateness)
+
+        if self._armed:
+            if self._fired_at is None and self.trigger.check(
+                self.columns, self._previous, row
+            ):
+                # This sample is the first one after the trigger
+                self._fired_at = time.perf_counter()
+            if self._fired_at is not None:
+                if self._capture_from is None:
+                    self._capture_from = self.buffer.count - 1
+                    self.trigger_latency.append(
+                        time.perf_counter() - self._fired_at
+                    )
+                if self.buffer.count - self._capture_from >= self.post:
+                    self._capture()
+        self._previous = row
+
+        if self.store is not None and (
+            self.buffer.count - self._stored >= self.capacity // 2 or
+            time.perf_counter() - self._stored_at >= self.flush_interval
+        ):
+            self._persist()
+
+    def _persist(self):
+        """
+        Queue the samples taken since the last call for the store.
+        """
+        pending = self.buffer.count - self._stored
+        if pending:
+            self._pending.put(self.buffer.last(pending))
+        self._stored = self.buffer.count
+        self._stored_at = time.perf_counter()
+
+    def _append(self, rows):
+        try:
+            self.store.append(rows)
+            self.store.flush()
+        except Exception:
+            logger.exception("Saving samples to %s failed", self.store)
+
+    def _write_store(self):
+        while True:
+            rows = self._pending.get()
+            try:
+                if rows is None:
+                    return
+                self._append(rows)
+            finally:
+                self._pending.task_done()
+
+    def _write_pending(self):
+        while True:
+            try:
+                rows = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if rows is not None:
+                self._append(rows)
+            self._pending.task_done()
+
+    def _fire(self, fired_at):
+        """
+        Called by the trigger, wakes the sampler to take the first
+        sample after the trigger straight away.
+        """
+        if self._armed and self._fired_at is None:
+            self._fired_at = fired_at
+            self._wake.set()
+
+    def _capture(self):
+        available = self.buffer.count - self._capture_from
+        window = self.buffer.last(min(len(self.buffer), self.pre + available))
+        with self._captured:
+            self.captures.append(window)
+            self._captured.notify_all()
+        self._fired_at = None
+        self._capture_from = None
+        self._armed = self.rearm
+
+    def arm(self):
+        """
+        Wait for the trigger again after a capture.
+        """
+        self._fired_at = None
+        self._capture_from = None
+        self._armed = True
+
+    def wait(self, timeout=None):
+        """
+        Wait for the next capture, returning its array of samples, or
+        None if there was no capture within `timeout` seconds.
+        """
+        with self._captured:
+            count = len(self.captures)
+            if self._captured.wait_for(
+                lambda: len(self.captures) > count,
+                timeout
+            ):
+                return self.captures[-1]
+        return None
+
+    def _monitor(self):
+        """
+        Sample on a fixed schedule measured from the start, so sleep
+        and command latency don't accumulate as drift. Samples that
+        can't be taken on time are skipped and counted as missed.
+
+        A trigger firing between samples restarts the schedule from
+        the moment it fired.
+        """
+        period = 1.0 / self.frequency
+        start = self._started
+        wall_start = self.started_at - start
+        # Carry on from the first sample if `start` took it
+        k = self.samples
+        while True:
+            target = start + k * period
+            now = time.perf_counter()
+            if now < target:
+                self._wake.wait(target - now)
+            if self._stop.is_set():
+                break
+
+            now = time.perf_counter()
+            if self._wake.is_set():
+                self._wake.clear()
+                if self._fired_at is not None and self._capture_from is None:
+                    start = target = now
+                    k = 0
+
+            behind = int((now - target) // period)
+            if behind > 0:
+                self.missed += behind
+                k += behind
+                target = start + k * period
+            self._record(wall_start + now, now - target)
+            k += 1
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not self.mode & (MONITOR | TRIGGER):
+            raise ValueError("Unsupported experiment mode {}".format(self.mode))
+        if self.mode & TRIGGER and self.trigger is None:
+            raise ValueError("TRIGGER mode needs a trigger")
+        self._stop.clear()
+        self._wake.clear()
+        self._reset_stats()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        if self.columns is None:
+            # The first sample sizes the columns and opens the store,
+            # so take it here for any problem with them to be raised
+            self._record(self.started_at, 0.0)
+        if self.mode & TRIGGER:
+            self.trigger.attach(self._fire)
+            self.arm()
+        self._thread = threading.Thread(
+            target=self._monitor,
+            name='xtralien-experiment',
+            daemon=True
+        )
+        self._thread.start()
+        if self.store is not None and self._writer is None:
+            self._writer = threading.Thread(
+                target=self._write_store,
+                name='xtralien-experiment-store',
+                daemon=True
+            )
+            self._writer.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        if self.trigger is not None and self.mode & TRIGGER:
+            self.trigger.detach()
+        self._armed = False
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        if self._writer is not None:
+            self._persist()
+            self._pending.put(None)
+            self._writer.join()
+            self._writer = None
+
+    @property
+    def data(self):
+        """
+        The samples in the buffer, oldest first.
+        """
+        if self.buffer is None:
+            return numpy.empty((0, 1))
+        return self.buffer.values()
+
+    def save(self, fname=None):
+        """
+        Write any samples not yet stored to the experiment's store, or
+        the buffered samples to a new store at `fname`, returning the
+        store.
+        """
+        if self.buffer is None:
+            return None
+        if fname is not None:
+            with ResultStore(fname, columns=self.columns) as store:
+                store.append(self.data)
+            return store
+        if not isinstance(self.store, ResultStore):
+            return None
+        self._persist()
+        if self._writer is None:
+            self._write_pending()
+        else:
+            self._pending.join()
+        self.store.close()
+        return self.store
@@ -9,9 +9,14 @@ them a lot so we included them here.
 
 import csv
 from glob import glob  # noqa: F401
+import importlib
+import itertools
+import json
 import os  # noqa: F401
+import queue
 import re  # noqa: F401
 import sys  # noqa: F401
+import threading
 
 import base64  # noqa: F401
 import base64 as b64  # noqa: F401
@@ -19,6 +24,8 @@ import decimal  # noqa: F401
 
 # Time
 from time import *  # noqa: F401
+# `time` is the module, as matplotlib's star import used to make it
+import time  # noqa: F811
 
 # Warnings
 from warnings import *  # noqa: F403
@@ -28,21 +35,74 @@ import xtralien  # noqa: F401
 from xtralien import X100, Device  # noqa: F401
 from xtralien.serial_utils import serial_ports  # noqa: F401
 
-# Scipy
-import scipy  # noqa: F401
-from scipy import *  # noqa: F401
+# Scipy, Numpy and Matplotlib are slow to import, so they are only
+# imported when one of their names is first used (see __getattr__).
+_modules = {
+    'np': 'numpy',
+    'plt': 'matplotlib.pyplot',
+    'scipy': 'scipy',
+}
 
-# Numpy
-import numpy as np  # noqa: F401
-from numpy import *  # noqa: F401
-from numpy.random import *  # noqa: F401
+# 3D plotting
+_attributes = {
+    'axes3d': ('mpl_toolkits.mplot3d', 'axes3d'),
+    'Axes3D': ('mpl_toolkits.mplot3d', 'Axes3D'),
+}
 
-# Matplotlib
-import matplotlib.pyplot as plt  # noqa: F401
-from matplotlib.pyplot import *  # noqa: F401
+# The modules that used to be star-imported, in the order their names
+# take precedence. Matplotlib is last so that numeric names don't
+# import it; the only name it used to take from the others is `time`,
+# which is bound above.
+_star_modules = ('numpy.random', 'numpy', 'scipy', 'matplotlib.pyplot')
+
+_hidden = {'euler_gamma'}
+
+
+def _public(module):
+    names = getattr(module, '__all__', None)
+    if names is None:
+        names = [name for name in vars(module) if not name.startswith('_')]
+    return names
+
+
+def __getattr__(name):
+    if name == '__all__':
+        # Only needed by `from xtralien.imports import *`, which still
+        # imports everything
+        names = {x for x in globals() if not x.startswith('_')}
+        for module in _star_modules:
+            names.update(
+                x for x in _public(importlib.import_module(module))
+                if not x.startswith('__')
+            )
+        names.update(_modules)
+        names.update(_attributes)
+        value = sorted(names - _hidden)
+    elif name in _modules:
+        value = importlib.import_module(_modules[name])
+    elif name in _attributes:
+        (module, attribute) = _attributes[name]
+        value = getattr(importlib.import_module(module), attribute)
+    elif name in _hidden or name.startswith('__'):
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+    else:
+        for module in _star_modules:
+            module = importlib.import_module(module)
+            if name in _public(module):
+                value = getattr(module, name)
+                break
+        else:
+            raise AttributeError(
+                "module {!r} has no attribute {!r}".format(__name__, name)
+            )
+    globals()[name] = value
+    return value
 
-# 3D plotting
-from mpl_toolkits.mplot3d import axes3d, Axes3D  # noqa: F401
+
+def __dir__():
+    return __getattr__('__all__')
 
 
 def print_header(*args):
@@ -65,38 +125,310 @@ def array_to_csv(arr, fname, *args, **kwargs):
 
     The array should be a numpy array.
     """
+    import numpy as np
     try:
-        savetxt(fname, arr, *args, delimiter=",", **kwargs)
+        np.savetxt(fname, arr, *args, delimiter=",", **kwargs)
     except (IOError, ValueError):
-        savetxt(fname, arr, *args, delimiter=",", fmt="%s", **kwargs)
+        np.savetxt(fname, arr, *args, delimiter=",", fmt="%s", **kwargs)
+
+
+class CSVWriter(object):
+    """
+    A csv file that rows can be appended to while it is open.
+
+    Rows are queued and written in batches by a thread of its own, so
+    `write` never waits for the disk and can be called from any thread.
+    The file is flushed every `batch_rows` rows or `flush_interval`
+    seconds, whichever comes first. If `max_bytes` is set, the file is
+    renamed to the first unused of `name.1.csv`, `name.2.csv`, ... once
+    it grows past that and a new file is started.
+    """
+    def __init__(self, fname, header=None, fmt='%.18e', batch_rows=1024,
+                 flush_interval=1.0, max_bytes=None):
+        self.fname = fname
+        self.header = header
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotations = 0
+        self.error = None
+        self._queue = queue.Queue()
+        self._file = None
+        self._thread = threading.Thread(
+            target=self._run,
+            name='xtralien-csv',
+            daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
+    def _check(self):
+        if self.error is not None:
+            raise self.error
 
-def load_csv(fname, skip_headers=False, *args, **kwargs):
+    def write(self, row):
+        """
+        Queue a single row to be written.
+        """
+        import numpy as np
+        if self._thread is None:
+            raise ValueError("Write to closed CSVWriter")
+        self._check()
+        self._queue.put(np.atleast_2d(row))
+
+    def write_rows(self, rows):
+        """
+        Queue a 2D array of rows to be written.
+        """
+        import numpy as np
+        if self._thread is None:
+            raise ValueError("Write to closed CSVWriter")
+        self._check()
+        self._queue.put(np.atleast_2d(rows))
+
+    def flush(self):
+        """
+        Wait for the queued rows to be written to the file.
+        """
+        if self._thread is None:
+            raise ValueError("Flush of closed CSVWriter")
+        flushed = threading.Event()
+        self._queue.put(flushed)
+        flushed.wait()
+        self._check()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._check()
+
+    def _open(self):
+        self._file = open(self.fname, 'a')
+        if self.header is not None and self._file.tell() == 0:
+            self._file.write(self.header + '\n')
+
+    def _rotate(self):
+        self._file.close()
+        (base, ext) = os.path.splitext(self.fname)
+        self.rotations += 1
+        # Files from earlier runs are kept
+        index = 1
+        while True:
+            rotated = '{}.{}{}'.format(base, index, ext or '.csv')
+            if not os.path.exists(rotated):
+                break
+            index += 1
+        os.replace(self.fname, rotated)
+        self._open()
+
+    def _format(self, rows):
+        # One format string for the whole batch is much faster than
+        # formatting each row separately
+        line = ','.join([self.fmt] * rows.shape[1]) + '\n'
+        try:
+            return (line * len(rows)) % tuple(rows.ravel())
+        except TypeError:
+            line = ','.join(['%s'] * rows.shape[1]) + '\n'
+            return (line * len(rows)) % tuple(rows.ravel())
+
+    def _write(self, batch):
+        for rows in batch:
+            self._file.write(self._format(rows))
+        self._file.flush()
+        if self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _run(self):
+        batch = []
+        count = 0
+        flush_at = None
+        running = True
+        while running:
+            flushed = None
+            timeout = None
+            if flush_at is not None:
+                timeout = flush_at - monotonic()
+                timeout = timeout if timeout > 0 else 0
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            else:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    flushed = item
+                    item = None
+
+            if item is not None:
+                batch.append(item)
+                count += len(item)
+                if flush_at is None:
+                    flush_at = monotonic() + self.flush_interval
+            if batch and (
+                item is None or count >= self.batch_rows or
+                monotonic() >= flush_at
+            ):
+                try:
+                    if self._file is None:
+                        self._open()
+                    self._write(batch)
+                except Exception as e:
+                    self.error = e
+                (batch, count, flush_at) = ([], 0, None)
+            if flushed is not None:
+                flushed.set()
+
+        if self._file is not None:
+            self._file.close()
+
+
+def _convert_rows(rows):
+    """
+    Convert rows of strings from a CSV to an array.
+
+    Each column is converted to floats in one go; only columns that
+    aren't entirely numeric are converted cell by cell, keeping the
+    cells that aren't numbers as strings.
+    """
+    import numpy as np
+    width = int(np.max([len(row) for row in rows], initial=0))
+    cells = np.array(
+        [row + [''] * (width - len(row)) for row in rows],
+        dtype=str
+    ).reshape(len(rows), width)
+
+    columns = []
+    numeric = True
+    for i in range(width):
+        try:
+            columns.append(cells[:, i].astype(float))
+        except ValueError:
+            numeric = False
+            columns.append(np.array(
+                [_to_number(cell) for cell in cells[:, i]],
+                dtype=object
+            ))
+
+    if numeric:
+        return np.column_stack(columns) if columns else np.empty(cells.shape)
+    arr = np.empty((len(rows), width), dtype=object)
+    for (i, column) in enumerate(columns):
+        arr[:, i] = column
+    return arr
+
+
+def _to_number(cell):
+    try:
+        return float(cell)
+    except ValueError:
+        return str(cell)
+
+
+def _parse_lines(lines, *args, **kwargs):
+    import numpy as np
+    try:
+        return np.loadtxt(lines, *args, delimiter=',', ndmin=2, **kwargs)
+    except (IOError, ValueError):
+        return _convert_rows(list(csv.reader(lines, delimiter=',')))
+
+
+def iter_csv(fname, skip_headers=False, chunk_rows=65536, *args, **kwargs):
+    """
+    Read a csv file in blocks of up to `chunk_rows` rows, for files
+    that are too big to load at once.
+
+    @return Iterator of numpy arrays
+    """
+    with open(fname, 'r') as fileh:
+        if skip_headers:
+            fileh.readline()
+
+        while True:
+            lines = list(itertools.islice(fileh, chunk_rows))
+            if not lines:
+                break
+            yield _parse_lines(lines, *args, **kwargs)
+
+
+def _cache_paths(fname):
+    return (fname + '.cache.npy', fname + '.cache.json')
+
+
+def _load_cache(fname, key):
+    import numpy as np
+    (data, meta) = _cache_paths(fname)
+    try:
+        with open(meta) as f:
+            if json.load(f) != key:
+                return None
+        return np.load(data, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cache(fname, key, arr):
+    import numpy as np
+    (data, meta) = _cache_paths(fname)
+    try:
+        with open(data + '.tmp', 'wb') as f:
+            np.save(f, arr)
+        os.replace(data + '.tmp', data)
+        with open(meta + '.tmp', 'w') as f:
+            json.dump(key, f)
+        os.replace(meta + '.tmp', meta)
+    except OSError as e:
+        warn("Can't cache {}: {}".format(fname, e))
+
+
+def load_csv(fname, skip_headers=False, *args, cache=False, **kwargs):
     """
     Load a csv file from a given filename.
 
+    Columns that aren't numeric are returned as strings, in an object
+    array. With `cache` set, numeric data is also saved next to the
+    file and memory-mapped on the next load with the same arguments,
+    until the file changes.
+
     @return Numpy array
     """
-    arr = None
+    import numpy as np
+    key = None
+    if cache:
+        stat = os.stat(fname)
+        key = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'skip_headers': 1 if skip_headers else 0,
+            # Arguments for loadtxt, such as usecols, change the result
+            'arguments': repr((args, sorted(kwargs.items()))),
+        }
+        arr = _load_cache(fname, key)
+        if arr is not None:
+            return arr
 
-    with open(fname, 'r+') as fileh:
+    with open(fname, 'r') as fileh:
         if skip_headers:
             fileh.readline()
+        start = fileh.tell()
 
         try:
-            arr = loadtxt(fileh, *args, delimiter=',', **kwargs)  # noqa: F405
+            arr = np.loadtxt(fileh, *args, delimiter=',', **kwargs)
         except (IOError, ValueError):
-            import csv
-            reader = csv.reader(fileh, delimiter=',')
-            arr = []
-            for row in reader:
-                rowdata = []
-                for data in row:  # Datapoint in row
-                    try:
-                        rowdata.append(float(data))
-                    except ValueError:
-                        rowdata.append(data)
-                    arr.append(rowdata)
+            fileh.seek(start)
+            arr = _convert_rows(list(csv.reader(fileh, delimiter=',')))
+
+    if cache and arr.dtype != object:
+        _save_cache(fname, key, arr)
     return arr
 
 # Delete some constants
@@ -104,5 +436,3 @@ del altzone  # noqa: F821
 del daylight  # noqa: F821
 del timezone  # noqa: F821
 del tzname  # noqa: F821
-euler_gamma = None  # noqa: F821 # pylint: disable=locally-disabled,invalid-name
-del euler_gamma  # noqa: F821
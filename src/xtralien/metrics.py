@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing of each command sent to a device, broken down into phases.
+
+    metrics = dev.instrument()
+    dev.smu1.oneshot(1.0)
+    print(metrics.prometheus())
+
+Each command is recorded as a CommandSample with the time spent in
+each of PHASES and the bytes written and read, and is added to a
+histogram per command path and phase. Hooks are called with every
+sample, e.g. `log_hook` to log them.
+
+Instrumentation is off unless `Device.instrument()` is called, in which
+case the only cost is checking `Device.metrics` on each command.
+"""
+import bisect
+import threading
+
+from xtralien import logger
+from xtralien.cache import _is_number
+
+# Waiting for the device lock, the pause before writing, writing, from
+# the write until the response starts, receiving the rest of the
+# response and formatting it.
+PHASES = ('lock', 'sleep', 'write', 'first_byte', 'drain', 'format')
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def command_path(command, path=None):
+    """
+    The path to group the metrics of `command` under: the words of
+    `path` if it has any, otherwise the command without its numeric
+    arguments, so 'smu1 oneshot 0.1' and 'smu1 oneshot 0.2' share
+    histograms.
+    """
+    if path:
+        return ' '.join([str(x) for x in path])
+    if type(command) == bytes:
+        command = command.decode('utf-8')
+    words = command.split()
+    return ' '.join(words[:1] + [w for w in words[1:] if not _is_number(w)])
+
+
+def response_bytes(response):
+    """
+    The number of bytes a response took on the wire, before decoding.
+    """
+    if response is None:
+        return 0
+    if isinstance(response, str):
+        return len(response.encode('utf-8'))
+    return len(response)
+
+
+class CommandSample(object):
+    """
+    The timings of a single command. Phases are in seconds and `total`
+    covers all of them.
+    """
+    __slots__ = (
+        'path',
+        'lock',
+        'sleep',
+        'write',
+        'first_byte',
+        'drain',
+        'format',
+        'total',
+        'bytes_out',
+        'bytes_in'
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = 0.0
+        self.sleep = 0.0
+        self.write = 0.0
+        self.first_byte = 0.0
+        self.drain = 0.0
+        self.format = 0.0
+        self.total = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return "<CommandSample '{}' total={:.6f}/>".format(
+            self.path, self.total
+        )
+
+
+class Histogram(object):
+    """
+    Counts of observed values by bucket, as used by Prometheus.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # One count per bucket, plus values above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        An estimate of the `q` quantile, the upper bound of the bucket
+        it falls in.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for (bound, count) in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class CommandMetrics(object):
+    """
+    Histograms of command timings by command path and phase, with
+    counters of the bytes written and read.
+
+    `hooks` are called with each CommandSample as it is recorded.
+    """
+    def __init__(self, hooks=(), buckets=BUCKETS):
+        self.hooks = list(hooks)
+        self.buckets = buckets
+        self.histograms = {}
+        self.bytes_out = {}
+        self.bytes_in = {}
+        self._lock = threading.Lock()
+
+    def record(self, sample):
+        with self._lock:
+            path = sample.path
+            histograms = self.histograms.get(path)
+            if histograms is None:
+                histograms = self.histograms[path] = {
+                    phase: Histogram(self.buckets)
+                    for phase in PHASES + ('total',)
+                }
+            for (phase, histogram) in histograms.items():
+                histogram.observe(getattr(sample, phase))
+            self.bytes_out[path] = self.bytes_out.get(path, 0) + sample.bytes_out
+            self.bytes_in[path] = self.bytes_in.get(path, 0) + sample.bytes_in
+
+        for hook in self.hooks:
+            try:
+                hook(sample)
+            except Exception:
+                logger.exception("Metrics hook %s failed", hook)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.bytes_out = {}
+            self.bytes_in = {}
+
+    def summary(self):
+        """
+        The count, mean and approximate p50/p99 of each phase, by path.
+        """
+        with self._lock:
+            return {
+                path: {
+                    phase: {
+                        'count': h.count,
+                        'mean': h.sum / h.count if h.count else 0.0,
+                        'p50': h.quantile(0.5),
+                        'p99': h.quantile(0.99),
+                    }
+                    for (phase, h) in histograms.items()
+                }
+                for (path, histograms) in self.histograms.items()
+            }
+
+    def prometheus(self, prefix='xtralien_command'):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            '# HELP {}_seconds Time spent on each phase of a command'.format(
+                prefix
+            ),
+            '# TYPE {}_seconds histogram'.format(prefix),
+        ]
+        with self._lock:
+            for (path, histograms) in sorted(self.histograms.items()):
+                for (phase, h) in histograms.items():
+                    labels = 'path="{}",phase="{}"'.format(_escape(path), phase)
+                    seen = 0
+                    for (bound, count) in zip(h.buckets, h.counts):
+                        seen += count
+                        lines.append('{}_seconds_bucket{{{},le="{}"}} {}'.format(
+                            prefix, labels, bound, seen
+                        ))
+                    lines.append('{}_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                        prefix, labels, h.count
+                    ))
+                    lines.append('{}_seconds_sum{{{}}} {}'.format(
+                        prefix, labels, h.sum
+                    ))
+                    lines.append('{}_seconds_count{{{}}} {}'.format(
+                        prefix, labels, h.count
+                    ))
+
+            lines.append('# TYPE {}_bytes_total counter'.format(prefix))
+            for (direction, counts) in (
+                ('out', self.bytes_out),
+                ('in', self.bytes_in)
+            ):
+                for (path, count) in sorted(counts.items()):
+                    lines.append(
+                        '{}_bytes_total{{path="{}",direction="{}"}} {}'.format(
+                            prefix, _escape(path), direction, count
+                        )
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+def log_hook(sample):
+    """
+    A hook that logs each sample at debug level, with the timings as
+    `extra` fields for structured log handlers.
+    """
+    logger.debug(
+        "'%s' took %.6fs", sample.path, sample.total,
+        extra={'command': sample.as_dict()}
+    )
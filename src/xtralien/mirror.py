@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Skipping writes that wouldn't change anything on the device.
+
+    mirror = dev.mirror_state()
+    for _ in range(100):
+        dev.smu1.set.voltage(1.0, response=0)  # only sent once
+    print(mirror.saved)
+
+The mirror remembers the value last written successfully by each set
+command, the last word of a command containing 'set', and skips
+sending the same value again. Because other commands can change
+settings too, what is known about a module (its first word) is
+forgotten when a command that might change it is sent, by the same
+rules as the response cache (see `xtralien.cache.invalidated_path`),
+and a setting is forgotten when setting it fails.
+
+Everything is forgotten when the connection is reopened and on
+`Device.sync()`. Changes made by anything other than this Device, such
+as the front panel, aren't seen, so call `sync()` after them.
+"""
+import threading
+
+from xtralien.cache import invalidated_path
+
+
+class StateMirror(object):
+    """
+    The last value written to each settable path of a device, with
+    counts of the writes sent and saved by path.
+    """
+    def __init__(self):
+        self.state = {}
+        self.sent = 0
+        self.saved = 0
+        self.saved_by_path = {}
+        self._opened = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.state)
+
+    @staticmethod
+    def _split(command):
+        """
+        The words of a command, and its path and value if it is a set.
+        """
+        if type(command) == bytes:
+            command = command.decode('utf-8')
+        words = command.split()
+        if 'set' in words[:-1]:
+            return (words, tuple(words[:-1]), words[-1])
+        return (words, None, None)
+
+    def _invalidate(self, words):
+        path = invalidated_path(words)
+        if path is not None:
+            self.clear(path)
+
+    def _check_connection(self, connection):
+        opened = getattr(connection, 'opened', None)
+        if opened != self._opened:
+            self.clear()
+            self._opened = opened
+
+    def send(self, command, write, *args, connection=None):
+        """
+        Call `write(command, *args)` and return its response, unless
+        `command` sets something to the value it was last set to, in
+        which case the response from then is returned.
+        """
+        self._check_connection(connection)
+        (words, path, value) = self._split(command)
+        if not words:
+            return write(command, *args)
+        if path is None:
+            self._invalidate(words)
+            return write(command, *args)
+
+        with self._lock:
+            entry = self.state.get(path)
+            if entry is not None and entry[0] == value:
+                self.saved += 1
+                name = ' '.join(path)
+                self.saved_by_path[name] = self.saved_by_path.get(name, 0) + 1
+                return entry[1]
+
+        try:
+            response = write(command, *args)
+        except BaseException:
+            with self._lock:
+                self.state.pop(path, None)
+            raise
+        with self._lock:
+            self.state[path] = (value, response)
+            self.sent += 1
+        return response
+
+    def observe(self, command):
+        """
+        Forget whatever `command`, sent some other way, might change.
+        """
+        (words, path, _) = self._split(command)
+        if path is not None:
+            with self._lock:
+                self.state.pop(path, None)
+        elif words:
+            self._invalidate(words)
+
+    def clear(self, path=()):
+        """
+        Forget the values of paths starting with `path`, or everything
+        if it is empty.
+        """
+        prefix = tuple(path)
+        with self._lock:
+            if not prefix:
+                self.state.clear()
+                return
+            for key in [
+                key for key in self.state if key[:len(prefix)] == prefix
+            ]:
+                del self.state[key]
+
+    def __repr__(self):
+        return "<StateMirror paths={} sent={} saved={}/>".format(
+            len(self.state), self.sent, self.saved
+        )
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pacing decides how long to wait before writing each command.
+
+Every connection has a `pacing` policy, used when a command's
+`sleep_time` is left as PACED. Passing a number or None as
+`sleep_time` still sleeps for that long, or not at all.
+
+    dev.connection.pacing = FixedPacing(0.001)  # the old behaviour
+"""
+import time
+
+
+class _Paced(object):
+    def __repr__(self):
+        return 'PACED'
+
+
+# The default `sleep_time`, leaving the wait to the connection's pacing
+PACED = _Paced()
+
+
+class FixedPacing(object):
+    """
+    Wait `delay` seconds before every command, as the library always
+    used to.
+    """
+    def __init__(self, delay=0.001):
+        self.delay = delay
+
+    def wait_time(self):
+        return self.delay
+
+    def sent(self, returns):
+        pass
+
+    def received(self):
+        pass
+
+    def failed(self):
+        pass
+
+    def __repr__(self):
+        return "<FixedPacing delay={}/>".format(self.delay)
+
+
+class AdaptivePacing(object):
+    """
+    Only wait where the device might still be busy.
+
+    There is no wait once the response to the previous command has
+    arrived. After a command without a response, or one that failed,
+    the next write waits until `gap` seconds after it.
+
+    `gap` doubles, up to `max_gap`, every time a command fails, and
+    halves, down to `min_gap`, after `recover` responses in a row.
+    """
+    def __init__(self, gap=0.001, min_gap=0.0005, max_gap=0.05, recover=100):
+        self.gap = gap
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.recover = recover
+        self.failures = 0
+        self._written_at = 0.0
+        self._expects = False
+        self._answered = True
+        self._successes = 0
+
+    def wait_time(self):
+        """
+        How long to wait before the next write, in seconds.
+        """
+        if self._answered:
+            return 0.0
+        return max(0.0, self._written_at + self.gap - time.perf_counter())
+
+    def sent(self, returns):
+        self._written_at = time.perf_counter()
+        self._expects = bool(returns)
+        self._answered = False
+
+    def received(self):
+        if not self._expects:
+            return
+        self._answered = True
+        self._successes += 1
+        if self._successes >= self.recover:
+            self._successes = 0
+            self.gap = max(self.min_gap, self.gap / 2)
+
+    def failed(self):
+        self.failures += 1
+        self._successes = 0
+        self._answered = False
+        self.gap = min(self.max_gap, max(self.min_gap, self.gap * 2))
+
+    def __repr__(self):
+        return "<AdaptivePacing gap={:.6f} failures={}/>".format(
+            self.gap, self.failures
+        )
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Send the same commands to many devices at once.
+
+    with DevicePool.discover() as pool:
+        pool.smu1.set.enabled(1, response=0)
+        result = pool.smu1.oneshot(1.0)
+        print(result.array, result.errors)
+"""
+import concurrent.futures
+import threading
+
+from xtralien import Command, Device, logger
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PoolResult(dict):
+    """
+    The responses from a DevicePool command, keyed by device.
+
+    Devices that failed are left out and their exceptions are kept in
+    `errors` instead.
+    """
+    def __init__(self, *args, **kwargs):
+        super(PoolResult, self).__init__(*args, **kwargs)
+        self.errors = {}
+
+    @property
+    def devices(self):
+        return list(self.keys())
+
+    @property
+    def array(self):
+        """
+        The responses stacked into one array, in the order of `devices`,
+        which needs every response to have the same shape. An empty
+        array is returned if every device failed.
+
+        :raises ValueError:
+            If the responses have different shapes, e.g. a truncated
+            sweep
+        """
+        if numpy is None:
+            raise ImportError("PoolResult.array needs numpy")
+        if not self:
+            return numpy.empty(0)
+        arrays = [numpy.asarray(x) for x in self.values()]
+        shapes = {a.shape for a in arrays}
+        if len(shapes) > 1:
+            raise ValueError(
+                "Can't stack responses of different shapes: {}".format(
+                    ', '.join(
+                        '{} from {}'.format(a.shape, device)
+                        for (device, a) in zip(self.keys(), arrays)
+                    )
+                )
+            )
+        return numpy.stack(arrays)
+
+
+class DevicePool(object):
+    """
+    A group of devices that are sent every command concurrently, so a
+    command takes about as long as the slowest device.
+    """
+    def __init__(self, devices=(), max_workers=32):
+        self.devices = list(devices)
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, x):
+        if '__' in x:
+            raise AttributeError(x)
+        return Command(self, (x,))
+
+    def __getitem__(self, x):
+        return Command(self, (x,))
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='xtralien-pool'
+                )
+            return self._executor
+
+    def add(self, device):
+        self.devices.append(device)
+
+    def call(self, selection, args=(), **kwargs):
+        """
+        Send a command to every device and gather the responses.
+        """
+        return self.map(
+            lambda device: device.call(selection, args, **kwargs)
+        )
+
+    def __call__(self, *args, **kwargs):
+        return self.call((), args, **kwargs)
+
+    def map(self, function, *args, **kwargs):
+        """
+        Call `function(device, *args, **kwargs)` for every device at
+        once, for work that is more than a single command.
+        """
+        futures = [
+            (device, self.executor.submit(function, device, *args, **kwargs))
+            for device in self.devices
+        ]
+        result = PoolResult()
+        for (device, future) in futures:
+            try:
+                result[device] = future.result()
+            except Exception as e:
+                logger.warning("%s failed: %s", device, e)
+                result.errors[device] = e
+        return result
+
+    def close(self):
+        with self._executor_lock:
+            (executor, self._executor) = (self._executor, None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for device in self.devices:
+            device.close()
+
+    def __repr__(self):
+        return "<DevicePool devices={}/>".format(len(self.devices))
+
+    @staticmethod
+    def discover(*args, **kwargs):
+        return DevicePool(Device.discover(*args, **kwargs))
+
+    @staticmethod
+    def USB(*ports, **kwargs):
+        return DevicePool([Device.USB(port, **kwargs) for port in ports])
+
+    @staticmethod
+    def Network(*ips, **kwargs):
+        return DevicePool([Device.Network(ip, **kwargs) for ip in ips])
@@ -1,38 +1,120 @@
+import concurrent.futures
 import glob
-import serial
+import os
 import sys
 
+# (vendor, product) USB IDs, as lower case hex strings, of the ports
+# that serial_ports() should list. Empty lists every USB serial port.
+usb_ids = ()
 
-def serial_ports():
-    """Lists serial ports
+# Where sysfs is mounted
+_sysfs = '/sys'
 
-    :raises EnvironmentError:
-        On unsupported or unknown platforms
-    :returns:
-        A list of available serial ports
+_cache = {
+    'candidates': None,
+    'ports': []
+}
+
+
+def _read_id(path, name):
+    try:
+        with open(os.path.join(path, name)) as f:
+            return f.read().strip().lower()
+    except OSError:
+        return None
+
+
+def _usb_serial_ports(ids):
     """
+    USB serial ports found through sysfs, without opening them.
+    """
+    ports = []
+    devices = os.path.join(os.path.realpath(_sysfs), 'devices') + os.sep
+    for path in glob.glob(os.path.join(_sysfs, 'class', 'tty', '*', 'device')):
+        # Walk up from the tty to the USB device it belongs to
+        device = os.path.realpath(path)
+        while device.startswith(devices):
+            vendor = _read_id(device, 'idVendor')
+            if vendor is not None:
+                break
+            device = os.path.dirname(device)
+        else:
+            continue
+
+        if ids and (vendor, _read_id(device, 'idProduct')) not in ids:
+            continue
+        ports.append('/dev/' + path.split('/')[-2])
+    return sorted(ports)
+
+
+def _candidates(usb_only, ids):
     if sys.platform.startswith('win'):
-        ports = ['COM' + str(i + 1) for i in range(256)]
+        try:
+            from serial.tools.list_ports import comports
+        except ImportError:
+            return ['COM' + str(i + 1) for i in range(256)]
+        # Only the ports that are present, so the cache sees changes
+        return sorted(port.device for port in comports())
 
     elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
+        if usb_only and os.path.isdir(os.path.join(_sysfs, 'class', 'tty')):
+            return _usb_serial_ports(ids)
         # this is to exclude your current terminal "/dev/tty"
-        ports = glob.glob('/dev/tty[A-Za-z0-9]*')
+        return sorted(glob.glob('/dev/tty[A-Za-z0-9]*'))
 
     elif sys.platform.startswith('darwin'):
-        ports = glob.glob('/dev/tty.usb*')
+        return glob.glob('/dev/tty.usb*')
 
     else:
         raise EnvironmentError('Unsupported platform')
 
+
+def _probe(port):
+    # Imported here so that importing xtralien doesn't import serial
+    import serial
+    try:
+        s = serial.Serial(port, timeout=0.01)
+        s.close()
+        return True
+    except (OSError, serial.SerialException):
+        return False
+
+
+def serial_ports(usb_only=True, ids=None, refresh=False):
+    """Lists serial ports
+
+    On Linux only USB serial ports (matching `ids`, or `usb_ids` by
+    default) are considered. The remaining ports are opened in
+    parallel to check they are available, and the result is reused
+    until the set of ports changes, unless `refresh` is set.
+
+    :raises EnvironmentError:
+        On unsupported or unknown platforms
+    :returns:
+        A list of available serial ports
+    """
+    ids = usb_ids if ids is None else ids
+    candidates = _candidates(usb_only, ids)
+    key = (tuple(candidates), usb_only, tuple(ids))
+    if not refresh and key == _cache['candidates']:
+        return list(_cache['ports'])
+
     result = []
-    for port in ports:
-        try:
-            s = serial.Serial(port, timeout=0.01)
-            s.close()
-            result.append(port)
-        except (OSError, serial.SerialException):
-            pass
-    return result
+    if candidates:
+        workers = min(32, len(candidates))
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            result = [
+                port
+                for (port, available) in zip(
+                    candidates,
+                    executor.map(_probe, candidates)
+                )
+                if available
+            ]
+
+    _cache['candidates'] = key
+    _cache['ports'] = result
+    return list(result)
 
 
 if __name__ == '__main__':
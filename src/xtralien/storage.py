@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only binary storage for experiment results.
+
+A store is a directory of `.npy` segments, one file per column per
+segment, and an `index.json` listing the columns and how many rows
+have been written:
+
+    with ResultStore('run.results', columns=['time', 'v']) as store:
+        store.append(rows)
+
+    store = ResultStore('run.results')
+    total = sum(block.sum() for block in store.segments('v'))
+
+Segments are written through memory maps and the index is replaced
+atomically when flushed, so a crash loses at most the rows since the
+last flush. `segments()` reads them as memory maps without copying, so
+a store doesn't have to fit in memory. `column()` (and `store['v']`)
+and `read()` join the segments into a new array, which is only free for
+stores of a single segment.
+"""
+import json
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+INDEX = 'index.json'
+VERSION = 1
+
+
+class ResultStore(object):
+    """
+    An append-only table of `columns` stored under the directory
+    `path`. Opening an existing store carries on where it left off.
+    """
+    def __init__(self, path, columns=None, dtype='float64',
+                 segment_rows=65536):
+        self.path = path
+        index = os.path.join(path, INDEX)
+        if os.path.exists(index):
+            with open(index) as f:
+                meta = json.load(f)
+            if columns is not None and list(columns) != meta['columns']:
+                raise ValueError(
+                    "{} has columns {}, not {}".format(
+                        path, meta['columns'], list(columns)
+                    )
+                )
+            self.columns = meta['columns']
+            self.dtype = numpy.dtype(meta['dtype'])
+            self.segment_rows = meta['segment_rows']
+            self.rows = meta['rows']
+        else:
+            if columns is None:
+                raise ValueError("A new store needs its columns")
+            os.makedirs(path, exist_ok=True)
+            self.columns = list(columns)
+            self.dtype = numpy.dtype(dtype)
+            self.segment_rows = segment_rows
+            self.rows = 0
+            self._write_index()
+
+        # Rows appended, including those not yet in the index
+        self._pending = self.rows
+        # Memory maps of the segment being appended to
+        self._segment = None
+        self._maps = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, column):
+        return self.column(column)
+
+    def _segment_path(self, segment, column):
+        return os.path.join(
+            self.path,
+            '{:06d}.{}.npy'.format(segment, self.columns.index(column))
+        )
+
+    def _write_index(self):
+        index = os.path.join(self.path, INDEX)
+        with open(index + '.tmp', 'w') as f:
+            json.dump({
+                'version': VERSION,
+                'columns': self.columns,
+                'dtype': self.dtype.str,
+                'segment_rows': self.segment_rows,
+                'rows': self.rows,
+            }, f)
+        os.replace(index + '.tmp', index)
+
+    def _open_segment(self, segment):
+        if self._segment == segment:
+            return self._maps
+        self._flush_maps()
+        maps = []
+        for column in self.columns:
+            fname = self._segment_path(segment, column)
+            if os.path.exists(fname):
+                # Left over from before a crash or from a previous run
+                maps.append(open_memmap(fname, mode='r+'))
+            else:
+                maps.append(open_memmap(
+                    fname,
+                    mode='w+',
+                    dtype=self.dtype,
+                    shape=(self.segment_rows,)
+                ))
+        self._segment = segment
+        self._maps = maps
+        return maps
+
+    def _flush_maps(self):
+        if self._maps is not None:
+            for m in self._maps:
+                m.flush()
+        self._segment = None
+        self._maps = None
+
+    def append(self, rows):
+        """
+        Append a 2D array with one column per store column. The rows
+        are only recorded in the index by the next `flush()`.
+        """
+        rows = numpy.asarray(rows, dtype=self.dtype)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        if rows.shape[1] != len(self.columns):
+            raise ValueError(
+                "Expected {} columns, got {}".format(
+                    len(self.columns), rows.shape[1]
+                )
+            )
+
+        written = 0
+        while written < len(rows):
+            (segment, offset) = divmod(self._pending, self.segment_rows)
+            n = min(len(rows) - written, self.segment_rows - offset)
+            maps = self._open_segment(segment)
+            for (i, m) in enumerate(maps):
+                m[offset:offset + n] = rows[written:written + n, i]
+            written += n
+            self._pending += n
+
+    def flush(self):
+        """
+        Write the appended rows to disk and record them in the index.
+        """
+        if self._maps is not None:
+            for m in self._maps:
+                m.flush()
+        if self._pending != self.rows:
+            self.rows = self._pending
+            self._write_index()
+
+    def close(self):
+        self.flush()
+        self._flush_maps()
+
+    def segments(self, column):
+        """
+        Yield read-only memory maps of each segment of `column`, in
+        order. This is the way to go through a long store, as nothing
+        is copied or held in memory.
+        """
+        remaining = self.rows
+        segment = 0
+        while remaining > 0:
+            n = min(remaining, self.segment_rows)
+            data = numpy.load(
+                self._segment_path(segment, column),
+                mmap_mode='r'
+            )
+            yield data[:n]
+            remaining -= n
+            segment += 1
+
+    def column(self, column):
+        """
+        The whole of `column`. A store with a single segment is
+        returned as a memory map without copying; otherwise the
+        segments are copied into a new array in memory, so use
+        `segments()` for stores that might not fit.
+        """
+        parts = list(self.segments(column))
+        if not parts:
+            return numpy.empty(0, self.dtype)
+        if len(parts) == 1:
+            return parts[0]
+        return numpy.concatenate(parts)
+
+    def read(self):
+        """
+        Every column as a 2D array in memory, in the order of
+        `columns`. The segments are copied straight into the array.
+        """
+        data = numpy.empty((self.rows, len(self.columns)), self.dtype)
+        for (i, column) in enumerate(self.columns):
+            start = 0
+            for part in self.segments(column):
+                data[start:start + len(part), i] = part
+                start += len(part)
+        return data
+
+    def __repr__(self):
+        return "<ResultStore {} rows={} columns={}/>".format(
+            self.path, self.rows, len(self.columns)
+        )
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watch for USB devices being attached and removed.
+
+    with DeviceWatcher() as watcher:
+        for (event, port) in watcher.events():
+            print(event, port)
+
+On Linux changes to /dev are reported by inotify, so nothing runs
+while waiting. Elsewhere the serial ports are polled.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+from xtralien import logger
+from xtralien.serial_utils import serial_ports
+
+ATTACHED = 'attached'
+DETACHED = 'detached'
+
+# inotify flags, from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+def _inotify(path):
+    """
+    Return an inotify file descriptor watching `path` for files being
+    created, removed or changing permissions, or None if unsupported.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    name = ctypes.util.find_library('c')
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+    if fd < 0:
+        return None
+
+    mask = IN_CREATE | IN_DELETE | IN_ATTRIB | IN_MOVED_TO
+    if libc.inotify_add_watch(fd, path.encode('utf-8'), mask) < 0:
+        logger.debug(
+            "Can't watch %s: %s", path, os.strerror(ctypes.get_errno())
+        )
+        os.close(fd)
+        return None
+    return fd
+
+
+class DeviceWatcher(object):
+    """
+    Reports serial ports appearing and disappearing.
+
+    `lister` returns the current ports, `serial_ports` by default, and
+    is called again whenever `path` changes (or every `poll_interval`
+    seconds without inotify).
+    """
+    def __init__(self, path='/dev', lister=None, poll_interval=0.5,
+                 use_inotify=True):
+        self.lister = lister or (lambda: serial_ports(refresh=True))
+        self.poll_interval = poll_interval
+        self.ports = set(self.lister())
+        self.callbacks = {ATTACHED: [], DETACHED: []}
+        self._fd = _inotify(path) if use_inotify else None
+        # Written to wake up a waiting watcher when it is stopped
+        (self._wake_r, self._wake_w) = socket.socketpair()
+        self._stopped = False
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def inotify(self):
+        return self._fd is not None
+
+    def _wait(self, timeout):
+        """
+        Wait up to `timeout` seconds for something that might have
+        changed the ports, returning False if nothing did.
+        """
+        if self._fd is None:
+            if timeout is None or timeout > self.poll_interval:
+                timeout = self.poll_interval
+            ready = select.select([self._wake_r], [], [], timeout)[0]
+            return not self._stopped and not ready
+
+        ready = select.select([self._fd, self._wake_r], [], [], timeout)[0]
+        if self._stopped or self._wake_r in ready or not ready:
+            return False
+        try:
+            while os.read(self._fd, 4096):
+                continue
+        except BlockingIOError:
+            pass
+        return True
+
+    def changes(self, timeout=None):
+        """
+        Wait up to `timeout` seconds (None for ever) for ports to be
+        attached or detached, returning a list of (event, port).
+        """
+        expires = None if timeout is None else time.monotonic() + timeout
+        while not self._stopped:
+            remaining = None
+            if expires is not None:
+                remaining = max(0, expires - time.monotonic())
+            if self._wait(remaining):
+                current = set(self.lister())
+                attached = current - self.ports
+                detached = self.ports - current
+                self.ports = current
+                if attached or detached:
+                    return (
+                        [(ATTACHED, port) for port in sorted(attached)] +
+                        [(DETACHED, port) for port in sorted(detached)]
+                    )
+            if expires is not None and time.monotonic() >= expires:
+                break
+        return []
+
+    def events(self, timeout=None):
+        """
+        Yield (event, port) as ports change, until the watcher is
+        stopped or nothing changes for `timeout` seconds.
+        """
+        while not self._stopped:
+            changes = self.changes(timeout)
+            if not changes:
+                return
+            for change in changes:
+                yield change
+
+    def wait_for_device(self, timeout=None):
+        """
+        Return the first available port, waiting for one to be
+        attached if there are none.
+
+        :raises TimeoutError:
+            If no port appears within `timeout` seconds
+        """
+        expires = None if timeout is None else time.monotonic() + timeout
+        while not self.ports:
+            remaining = None
+            if expires is not None:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        "No device attached within {}s".format(timeout)
+                    )
+            self.changes(remaining)
+        return sorted(self.ports)[0]
+
+    def on_attach(self, callback):
+        """
+        Call `callback(port)` from the watcher thread whenever a port
+        is attached, starting the thread if needed.
+        """
+        self.callbacks[ATTACHED].append(callback)
+        self.start()
+        return callback
+
+    def on_detach(self, callback):
+        """
+        Call `callback(port)` from the watcher thread whenever a port
+        is detached, starting the thread if needed.
+        """
+        self.callbacks[DETACHED].append(callback)
+        self.start()
+        return callback
+
+    def keep_connected(self, device):
+        """
+        Reopen the serial connections of `device` when their port is
+        attached again.
+        """
+        def reconnect(port):
+            for conn in device.connections:
+                if getattr(conn, 'port', None) == port:
+                    logger.info("Reconnecting to %s", port)
+                    conn.reopen()
+        return self.on_attach(reconnect)
+
+    def _run(self):
+        for (event, port) in self.events():
+            for callback in list(self.callbacks[event]):
+                try:
+                    callback(port)
+                except Exception:
+                    logger.exception("Callback for %s %s failed", port, event)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run,
+                name='xtralien-watcher',
+                daemon=True
+            )
+            self._thread.start()
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wake_w.send(b'x')
+        if self._thread is not None and (
+            self._thread is not threading.current_thread()
+        ):
+            self._thread.join()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def __repr__(self):
+        return "<DeviceWatcher ports={} {}/>".format(
+            sorted(self.ports),
+            'inotify' if self.inotify else 'polling'
+        )
@@ -0,0 +1,109 @@
+"""Tests for the asyncio device client
+
+These run against a local asyncio stand-in rather than a real device.
+"""
+import asyncio
+import unittest
+
+from xtralien.aio import AsyncDevice, AsyncSocketConnection
+from xtralien.emulator import Emulator
+
+
+async def stand_in(received):
+    """Start a server that answers every command with its own length
+    """
+    async def handle(reader, writer):
+        while True:
+            data = await reader.read(576)
+            if not data:
+                break
+            received.append(data.decode())
+            await asyncio.sleep(0.01)
+            writer.write('{}\n'.format(len(data)).encode())
+            await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+class TestAsyncDevice(unittest.TestCase):
+    """AsyncDevice tests
+    """
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_attribute_chain(self):
+        """Test that attribute and item chains build the same commands
+        """
+        async def run():
+            received = []
+            server = await stand_in(received)
+            port = server.sockets[0].getsockname()[1]
+            dev = AsyncDevice(
+                await AsyncSocketConnection.open('127.0.0.1', port)
+            )
+            async with dev:
+                self.assertEqual(await dev.smu1.measurev(), 13.0)
+                self.assertEqual(await dev['smu2'].oneshot(1.5), 16.0)
+                self.assertEqual(await dev.smu1.measurev(format=None), '13\n')
+            server.close()
+            return received
+
+        self.assertEqual(
+            self.run_async(run()),
+            ['smu1 measurev', 'smu2 oneshot 1.5', 'smu1 measurev']
+        )
+
+    def test_concurrent_devices(self):
+        """Test that commands to separate devices overlap
+        """
+        async def run():
+            server = await stand_in([])
+            port = server.sockets[0].getsockname()[1]
+            devices = [
+                AsyncDevice(
+                    await AsyncSocketConnection.open('127.0.0.1', port)
+                )
+                for _ in range(10)
+            ]
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            results = await asyncio.gather(*[
+                dev.smu1.measurev() for dev in devices for _ in range(5)
+            ])
+            elapsed = loop.time() - start
+            for dev in devices:
+                await dev.close()
+            server.close()
+            return results, elapsed
+
+        results, elapsed = self.run_async(run())
+        self.assertEqual(results, [13.0] * 50)
+        # 50 commands at 10 ms each would take 0.5 s in series
+        self.assertLess(elapsed, 0.3)
+
+    def test_unread_response(self):
+        """Test that a response nobody waited for is discarded
+        """
+        emulator = Emulator(
+            port=0,
+            discovery_port=None,
+            responses={'smu1 set voltage': 'OK\n', 'smu1 measurev': '1.5\n'}
+        )
+        emulator.start()
+        self.addCleanup(emulator.close)
+
+        async def run():
+            dev = AsyncDevice(
+                await AsyncSocketConnection.open('127.0.0.1', emulator.port)
+            )
+            async with dev:
+                await dev.smu1.set.voltage(1.0, response=0)
+                await asyncio.sleep(0.05)
+                return [await dev.smu1.measurev() for _ in range(2)]
+
+        self.assertEqual(self.run_async(run()), [1.5, 1.5])
+
+
+if __name__ == "__main__":
+    unittest.main()
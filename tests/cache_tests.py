@@ -0,0 +1,100 @@
+"""Tests for the response cache
+"""
+import time
+import unittest
+
+from xtralien import Device
+from xtralien.cache import ResponseCache
+from xtralien.emulator import Emulator
+
+
+class TestCache(unittest.TestCase):
+    """Response cache tests
+    """
+    def setUp(self):
+        self.emulator = Emulator(
+            port=0,
+            discovery_port=None,
+            responses={'serial': '0123456789ab\n'}
+        )
+        self.emulator.start()
+        self.addCleanup(self.emulator.close)
+        self.device = Device('127.0.0.1', self.emulator.port)
+        self.addCleanup(self.device.close)
+        self.written = []
+        write = self.device.connection.write
+
+        def record(command):
+            self.written.append(command)
+            return write(command)
+        self.device.connection.write = record
+
+    def test_get(self):
+        """Test that repeated queries are only sent once until a set
+        """
+        cache = self.device.cache_responses()
+        self.device.smu1.set.voltage(2, response=0)
+        self.assertEqual(self.device.smu1.get.voltage(), 2)
+        self.assertEqual(self.device.smu1.get.voltage(), 2)
+        self.assertEqual(len(self.written), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        self.device.smu1.set.voltage(3, response=0)
+        self.assertEqual(self.device.smu1.get.voltage(), 3)
+
+        # Commands that might change settings invalidate too
+        self.device.smu1.oneshot(2.0)
+        self.assertEqual(len(cache), 0)
+        self.device.smu1.get.voltage()
+        self.device.smu2.get.voltage()
+        self.device.reset(response=0)
+        self.assertEqual(len(cache), 0)
+
+        # Including streamed ones
+        self.device.smu1.get.voltage()
+        list(self.device.smu1.sweep.stream(0, 1))
+        self.assertEqual(len(cache), 0)
+
+        # Measurements aren't cached
+        del self.written[:]
+        self.device.smu1.measurev()
+        self.device.smu1.measurev()
+        self.assertEqual(len(self.written), 2)
+
+    def test_serial(self):
+        """Test that the serial number is kept
+        """
+        self.device.cache_responses()
+        serial = self.device.serial
+        self.assertEqual(self.device.serial, serial)
+        self.assertEqual(len(self.written), 1)
+
+    def test_expiry(self):
+        """Test TTLs and LRU eviction
+        """
+        cache = ResponseCache(ttl=0.01, maxsize=2, ttls={'smu1 get': 0})
+        self.assertIs(cache.ttl_for(('smu1', 'get', 'range')), False)
+        self.assertEqual(cache.ttl_for(('smu2', 'get', 'range')), 0.01)
+        self.assertIs(cache.ttl_for(('serial',)), None)
+
+        cache.put((('a',), 'auto'), 1, 0.01)
+        self.assertEqual(cache.get((('a',), 'auto')), (True, 1))
+        time.sleep(0.02)
+        self.assertEqual(cache.get((('a',), 'auto')), (False, None))
+
+        for name in 'abc':
+            cache.put(((name,), 'auto'), name, None)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get((('a',), 'auto')), (False, None))
+
+        # A response read before an invalidation isn't kept
+        generation = cache.generation
+        cache.observe('smu1 set voltage 1')
+        cache.put((('smu1', 'get', 'voltage'), 'auto'), 0, None, generation)
+        self.assertEqual(
+            cache.get((('smu1', 'get', 'voltage'), 'auto')), (False, None)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
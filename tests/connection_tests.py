@@ -0,0 +1,133 @@
+"""Tests for the Xtralien connection classes
+
+These run against local stand-ins rather than real devices.
+"""
+import os
+import socket
+import threading
+import time
+import unittest
+
+from xtralien import SerialConnection, SocketConnection
+
+
+def stand_in(responses):
+    """Start a TCP server that answers each packet with the next response
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def serve():
+        client, _ = server.accept()
+        with client:
+            for response in responses:
+                if not client.recv(576):
+                    break
+                client.sendall(response)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+class TestSocketConnection(unittest.TestCase):
+    """Socket connection tests
+    """
+    def connect(self, responses, **kwargs):
+        server = stand_in(responses)
+        self.addCleanup(server.close)
+        conn = SocketConnection('127.0.0.1', server.getsockname()[1], **kwargs)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_framed_read(self):
+        """Test that a terminated response is returned without a timeout
+        """
+        conn = self.connect([b'[1.0;2.0]\n', b'3.0\n'], timeout=1.0)
+        start = time.perf_counter()
+        conn.write('smu1 sweep')
+        self.assertEqual(conn.read(), '[1.0;2.0]\n')
+        conn.write('smu1 measurev')
+        self.assertEqual(conn.read(), '3.0\n')
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_unterminated_read(self):
+        """Test that an unterminated response ends after the timeout
+        """
+        conn = self.connect([b'OK'], timeout=0.05)
+        conn.write('smu1 set enabled 1')
+        self.assertEqual(conn.read(), 'OK')
+
+    def test_unterminated_frame(self):
+        """Test that frames end after the timeout or when closed
+        """
+        conn = self.connect([b'OK', b'1.0'], timeout=0.05)
+        conn.write('smu1 set enabled 1')
+        self.assertEqual(conn.read_frame(), 'OK')
+        conn.write('smu1 measurev')
+        with self.assertRaises(ConnectionError):
+            conn.read_frame()
+
+    def test_timeout_mode(self):
+        """Test the timeout read used when there is no terminator
+        """
+        conn = self.connect([b'1.0\n'], timeout=0.05, terminator=None)
+        conn.write('smu1 measurev')
+        self.assertEqual(conn.read(), '1.0\n')
+
+
+def pty_device(responses):
+    """Start a fake serial device on a pty that answers each command
+
+    Returns the path of the serial port to connect to.
+    """
+    master, slave = os.openpty()
+    port = os.ttyname(slave)
+
+    def serve():
+        for response in responses:
+            os.read(master, 576)
+            if response is not None:
+                os.write(master, response)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return master, slave, port
+
+
+@unittest.skipUnless(hasattr(os, 'openpty'), "Requires a pty")
+class TestSerialConnection(unittest.TestCase):
+    """Serial connection tests against a pty
+    """
+    def connect(self, responses, **kwargs):
+        master, slave, port = pty_device(responses)
+        conn = SerialConnection(port, **kwargs)
+        self.addCleanup(os.close, master)
+        self.addCleanup(os.close, slave)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_framed_read(self):
+        """Test reading terminated responses from the device
+        """
+        conn = self.connect([b'[1.0;2.0]\n', b'3.0\n'], timeout=1.0)
+        start = time.perf_counter()
+        conn.write('smu1 sweep')
+        self.assertEqual(conn.read(), '[1.0;2.0]\n')
+        conn.write('smu1 measurev')
+        self.assertEqual(conn.read(), '3.0\n')
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_deadline(self):
+        """Test that a missing response raises once the deadline passes
+        """
+        conn = self.connect([None])
+        conn.write('smu1 set enabled 1')
+        start = time.process_time()
+        with self.assertRaises(TimeoutError):
+            conn.read(deadline=0.2)
+        # Waiting should not use any noticeable CPU time
+        self.assertLess(time.process_time() - start, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
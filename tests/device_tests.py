@@ -0,0 +1,387 @@
+"""Tests for the Device class
+
+These run against a local TCP stand-in rather than a real device.
+"""
+import functools
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import xtralien
+from xtralien import Device
+from xtralien.emulator import Emulator
+from xtralien.pool import DevicePool, PoolResult
+
+
+def stand_in(delay=0.0):
+    """Start a server that answers newline separated commands
+
+    Commands containing 'set' have no response, anything else is
+    answered with the length of the command. Each packet received is
+    delayed by `delay` seconds to stand in for the round trip.
+
+    Returns the server socket and the list of commands received.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    received = []
+
+    def serve():
+        client, _ = server.accept()
+        with client:
+            while True:
+                data = client.recv(4096)
+                if not data:
+                    break
+                time.sleep(delay)
+                for command in data.split(b'\n'):
+                    received.append(command.decode())
+                    if b'set' not in command.split():
+                        client.sendall(b'%d\n' % len(command))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server, received
+
+
+class TestDevice(unittest.TestCase):
+    """Device tests
+    """
+    def connect(self, **kwargs):
+        server, received = stand_in(**kwargs)
+        self.addCleanup(server.close)
+        device = Device('127.0.0.1', server.getsockname()[1])
+        self.addCleanup(device.close)
+        return received, device
+
+    def test_command(self):
+        """Test a single command through the attribute syntax
+        """
+        received, device = self.connect()
+        self.assertEqual(device.smu1.measurev(), 13.0)
+        self.assertEqual(device['smu2'].oneshot(1), 14.0)
+        self.assertEqual(received, ['smu1 measurev', 'smu2 oneshot 1'])
+
+    def test_compile(self):
+        """Test that a compiled command sends the same command
+        """
+        received, device = self.connect()
+        oneshot = device.smu1.oneshot.compile()
+        self.assertEqual(oneshot(1), 14.0)
+        self.assertEqual(oneshot(1.5, 2), 18.0)
+        self.assertEqual(device.smu1.oneshot(1.5, 2), 18.0)
+        measure = device['smu2'].measurev.compile(format=None)
+        self.assertEqual(measure(), '13\n')
+        self.assertEqual(received, [
+            'smu1 oneshot 1',
+            'smu1 oneshot 1.5 2',
+            'smu1 oneshot 1.5 2',
+            'smu2 measurev'
+        ])
+
+    def test_threads(self):
+        """Test that threads sharing a device don't mix up commands
+        """
+        received, device = self.connect()
+        results = {}
+
+        def run(channel):
+            results[channel] = [
+                device['smu{}'.format(channel)].oneshot(10 ** channel)
+                for _ in range(20)
+            ]
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for channel in range(4):
+            self.assertEqual(results[channel], [14.0 + channel] * 20)
+        self.assertEqual(len(received), 80)
+
+    def test_callbacks(self):
+        """Test that callbacks share a small pool of threads
+        """
+        _, device = self.connect()
+        threads = threading.active_count()
+        values = []
+        futures = [
+            device.smu1.measurev(callback=values.append, sleep_time=None)
+            for _ in range(200)
+        ]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(values, [13.0] * 200)
+        self.assertLessEqual(
+            threading.active_count(),
+            threads + device.callback_workers
+        )
+
+    def test_stream(self):
+        """Test that a sweep is yielded in blocks as it arrives
+        """
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+        rows = ['{0},{1}'.format(i, i * 0.5) for i in range(2500)]
+        response = ('[' + ';'.join(rows) + ';]\n').encode()
+
+        def serve():
+            client, _ = server.accept()
+            with client:
+                client.recv(576)
+                # Send in uneven pieces, splitting rows and numbers
+                for i in range(0, len(response), 7001):
+                    client.sendall(response[i:i + 7001])
+                    time.sleep(0.01)
+
+        threading.Thread(target=serve, daemon=True).start()
+        device = Device('127.0.0.1', server.getsockname()[1])
+        self.addCleanup(device.close)
+
+        blocks = list(device.smu1.sweep.stream(0, 1, rows=1000))
+        self.assertEqual([len(b) for b in blocks], [1000, 1000, 500])
+        data = np.concatenate(blocks)
+        self.assertEqual(data.shape, (2500, 2))
+        self.assertEqual(data[-1].tolist(), [2499, 1249.5])
+
+    def test_stream_stopped(self):
+        """Test that a stream stopped early doesn't leave data behind
+        """
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+        rows = ['{0},{0}'.format(i) for i in range(2500)]
+        response = ('[' + ';'.join(rows) + ';]\n').encode()
+
+        def serve():
+            client, _ = server.accept()
+            with client:
+                client.recv(576)
+                for i in range(0, len(response), 7001):
+                    client.sendall(response[i:i + 7001])
+                    time.sleep(0.01)
+                client.recv(576)
+                client.sendall(b'1.5\n')
+
+        threading.Thread(target=serve, daemon=True).start()
+        device = Device('127.0.0.1', server.getsockname()[1])
+        self.addCleanup(device.close)
+
+        for block in device.smu1.sweep.stream(0, 1, rows=100):
+            with self.assertRaises(RuntimeError):
+                device.smu1.measurev()
+            break
+        del block
+        self.assertEqual(device.smu1.measurev(), 1.5)
+
+    def test_stream_threads(self):
+        """Test that an unfinished stream doesn't block other threads
+        """
+        emulator = Emulator(port=0, discovery_port=None, matrix_rows=1000)
+        emulator.start()
+        self.addCleanup(emulator.close)
+        device = Device('127.0.0.1', emulator.port)
+        self.addCleanup(device.close)
+
+        stream = device.smu1.sweep.stream(0, 1, rows=1)
+        next(stream)
+        errors = []
+
+        def other():
+            try:
+                device.smu1.measurev()
+            except RuntimeError as e:
+                errors.append(e)
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join(1.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 1)
+        stream.close()
+        self.assertIsInstance(device.smu1.measurev(), float)
+
+    def test_batch(self):
+        """Test that a batch is sent in one round trip, in order
+        """
+        received, device = self.connect(delay=0.02)
+        start = time.perf_counter()
+        with device.batch() as batch:
+            for i in range(50):
+                batch.smu1.set.voltage(i, response=0)
+            current = batch.smu1.measurei()
+            voltage = batch['smu1'].measurev(format=None)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+        self.assertEqual(current.result(), 13.0)
+        self.assertEqual(voltage.result(), '13\n')
+        self.assertEqual(batch.results, [None] * 50 + [13.0, '13\n'])
+        self.assertEqual(len(received), 52)
+        self.assertEqual(received[49], 'smu1 set voltage 49')
+
+    def test_batch_window(self):
+        """Test that responses are read back across pipeline windows
+        """
+        _, device = self.connect()
+        with device.batch(window=2) as batch:
+            for i in range(5):
+                batch.smu1.oneshot(10 ** i)
+        self.assertEqual(batch.results, [14.0, 15.0, 16.0, 17.0, 18.0])
+
+    def test_batch_unexpected_reply(self):
+        """Test that a reply to a command sent without a response
+        doesn't shift the responses after it
+        """
+        emulator = Emulator(
+            port=0,
+            discovery_port=None,
+            responses={'smu1 set voltage': 'ERR\n', 'smu1 measurev': '1.5\n'}
+        )
+        emulator.start()
+        self.addCleanup(emulator.close)
+        device = Device('127.0.0.1', emulator.port)
+        self.addCleanup(device.close)
+        with device.batch(sleep_time=0.05) as batch:
+            batch.smu1.set.voltage(1, response=0)
+            batch.smu1.measurev()
+            batch.smu1.measurev()
+        self.assertEqual(batch.results, [None, 1.5, 1.5])
+
+
+class TestDiscovery(unittest.TestCase):
+    """Network discovery tests
+    """
+    def setUp(self):
+        xtralien._discovery_cache.clear()
+        self.responder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.responder.bind(('127.0.0.1', 0))
+        self.port = self.responder.getsockname()[1]
+        self.requests = []
+
+        def respond():
+            while True:
+                try:
+                    (data, addr) = self.responder.recvfrom(4)
+                except OSError:
+                    return
+                self.requests.append(data)
+                self.responder.sendto(b'xtra', addr)
+
+        threading.Thread(target=respond, daemon=True).start()
+
+    def tearDown(self):
+        self.responder.close()
+
+    def scan(self, **kwargs):
+        return xtralien.scan_network('127.0.0.1', port=self.port, **kwargs)
+
+    def test_scan(self):
+        """Test that scanning finds devices without connecting
+        """
+        found = self.scan()
+        self.assertEqual(found, [xtralien.DeviceInfo('127.0.0.1')])
+        self.assertEqual(self.requests, [b'xtra'])
+
+    def test_cache(self):
+        """Test that repeated scans reuse the cached result
+        """
+        self.scan()
+        self.scan()
+        self.assertEqual(len(self.requests), 1)
+        self.scan(refresh=True)
+        self.assertEqual(len(self.requests), 2)
+        xtralien._discovery_cache.clear()
+        self.scan(ttl=0)
+        self.scan()
+        self.assertEqual(len(self.requests), 4)
+
+    def test_discover_refresh(self):
+        """Test that discover doesn't return devices that have gone
+        """
+        emulator = Emulator(port=0, discovery_port=0)
+        emulator.start()
+        self.addCleanup(emulator.close)
+        scan = functools.partial(
+            xtralien.scan_network,
+            port=emulator.discovery_port
+        )
+        with mock.patch('xtralien.scan_network', scan), \
+                mock.patch.object(xtralien.DeviceInfo, 'connect',
+                                  lambda info: info):
+            self.assertEqual(
+                Device.discover('127.0.0.1'),
+                [xtralien.DeviceInfo('127.0.0.1')]
+            )
+            emulator.close()
+            self.assertEqual(Device.discover('127.0.0.1'), [])
+            # Only scans that ask for it use the cache
+            self.assertEqual(len(scan('127.0.0.1')), 1)
+
+    def test_first(self):
+        """Test that the first device found is connected with the arguments
+        """
+        (server, _) = stand_in()
+        self.addCleanup(server.close)
+        found = [xtralien.DeviceInfo('127.0.0.1', server.getsockname()[1])]
+        with mock.patch('xtralien.watcher.serial_ports', return_value=[]), \
+                mock.patch.object(Device, 'scan', lambda **_: found):
+            device = Device.first(serial_timeout=0.5)
+        self.addCleanup(device.close)
+        self.assertEqual(device.connection.port, server.getsockname()[1])
+
+
+class TestDevicePool(unittest.TestCase):
+    """DevicePool tests
+    """
+    def test_broadcast(self):
+        """Test that commands run on every device at the same time
+        """
+        devices = []
+        for _ in range(4):
+            server, _ = stand_in(delay=0.1)
+            self.addCleanup(server.close)
+            devices.append(Device('127.0.0.1', server.getsockname()[1]))
+
+        with DevicePool(devices) as pool:
+            start = time.perf_counter()
+            result = pool.smu1.oneshot(1)
+            self.assertLess(time.perf_counter() - start, 0.3)
+        self.assertEqual(result.devices, devices)
+        self.assertEqual(result.array.tolist(), [14.0] * 4)
+        self.assertEqual(result.errors, {})
+
+    def test_failure(self):
+        """Test that one failing device doesn't stop the others
+        """
+        devices = []
+        for _ in range(2):
+            server, _ = stand_in()
+            self.addCleanup(server.close)
+            devices.append(Device('127.0.0.1', server.getsockname()[1]))
+        (working, broken) = devices
+        broken.connection.socket.close()
+
+        with DevicePool([working, broken]) as pool:
+            result = pool['smu1'].measurev(deadline=1.0)
+        self.assertEqual(result.devices, [working])
+        self.assertEqual(list(result.errors), [broken])
+
+    def test_array(self):
+        """Test stacking responses that can't be stacked
+        """
+        self.assertEqual(PoolResult().array.shape, (0,))
+        result = PoolResult(a=[1.0, 2.0], b=[1.0])
+        with self.assertRaises(ValueError):
+            result.array
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""Tests for the Xtralien device emulator
+"""
+import os
+import time
+import unittest
+
+from xtralien import Device, scan_network
+from xtralien.emulator import DROP, Emulator
+
+
+class TestEmulator(unittest.TestCase):
+    """Emulator tests
+    """
+    def start(self, **kwargs):
+        emulator = Emulator(port=0, discovery_port=0, **kwargs)
+        emulator.start()
+        self.addCleanup(emulator.close)
+        return emulator
+
+    def connect(self, emulator, *args):
+        device = Device(*(args or ('127.0.0.1', emulator.port)))
+        self.addCleanup(device.close)
+        return device
+
+    def test_commands(self):
+        """Test the made up responses and the stored settings
+        """
+        emulator = self.start(array_size=5, matrix_rows=3)
+        device = self.connect(emulator)
+        device.smu1.set.voltage(1.5, response=0)
+        self.assertEqual(device.smu1.get.voltage(), 1.5)
+        self.assertEqual(device.smu1.oneshot().shape, (1, 2))
+        self.assertEqual(device.smu1.sweep(0, 0.1, 1).shape, (3, 2))
+        self.assertEqual(device.smu1.array().shape, (5,))
+        self.assertIsInstance(device.smu1.measurev(), float)
+        self.assertEqual(emulator.commands, 6)
+
+    @unittest.skipUnless(hasattr(os, 'openpty'), "Requires a pty")
+    def test_pty(self):
+        """Test commands over the emulated serial port
+        """
+        emulator = self.start(responses={'cloi hello': 'Hello World\n'})
+        device = self.connect(emulator, emulator.open_pty())
+        self.assertEqual(device.cloi.hello(), 'Hello World')
+
+    def test_discovery(self):
+        """Test that discovery requests are answered
+        """
+        emulator = self.start()
+        found = scan_network(
+            '127.0.0.1',
+            port=emulator.discovery_port,
+            refresh=True
+        )
+        self.assertEqual([info.host for info in found], ['127.0.0.1'])
+
+    def test_faults(self):
+        """Test injected latency and dropped responses
+        """
+        emulator = self.start(latency=0.02, error_rate=1.0, errors=(DROP,))
+        device = self.connect(emulator)
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            device.smu1.measurev(deadline=0.1)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
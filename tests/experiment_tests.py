@@ -0,0 +1,175 @@
+"""Tests for Xtralien experiments
+
+Simple functions stand in for device channels.
+"""
+import itertools
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from xtralien.experiment import (
+    TRIGGER,
+    Experiment,
+    RingBuffer,
+    ResultStore,
+    SoftwareTrigger,
+    ThresholdTrigger
+)
+
+
+class TestRingBuffer(unittest.TestCase):
+    """Ring buffer tests
+    """
+    def test_wrap(self):
+        """Test that the oldest rows are overwritten once full
+        """
+        buffer = RingBuffer(4, 2)
+        for i in range(6):
+            buffer.append([i, -i])
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.values()[:, 0].tolist(), [2, 3, 4, 5])
+        self.assertEqual(buffer.last(2)[:, 1].tolist(), [-4, -5])
+
+
+class TestMonitor(unittest.TestCase):
+    """MONITOR mode tests
+    """
+    def test_fixed_rate(self):
+        """Test that samples follow the schedule without drifting
+        """
+        counter = itertools.count()
+
+        def slow():
+            # Stands in for command latency
+            time.sleep(0.002)
+            return 1.5
+
+        channels = {
+            'count': lambda: next(counter),
+            'slow': slow,
+            'pair': lambda: [[0.1, 0.2]]
+        }
+        with Experiment(devices=channels, frequency=200) as experiment:
+            time.sleep(0.5)
+
+        data = experiment.data
+        self.assertEqual(
+            experiment.columns,
+            ['time', 'count', 'slow', 'pair[0]', 'pair[1]']
+        )
+        self.assertEqual(data[:, 1].tolist(), list(range(len(data))))
+        self.assertTrue(np.all(data[:, 2] == 1.5))
+        # Sleeping 2 ms per sample mustn't slow the 5 ms schedule down
+        stats = experiment.stats
+        self.assertEqual(stats['samples'], len(data))
+        self.assertGreater(stats['samples'] + stats['missed'], 90)
+        self.assertAlmostEqual(np.mean(np.diff(data[:, 0])), 0.005, delta=0.001)
+
+    def test_errors(self):
+        """Test that a failing channel is recorded as missing data
+        """
+        def broken():
+            raise IOError("Device unplugged")
+
+        with Experiment(devices=[lambda: 1.0, broken], frequency=100) as exp:
+            time.sleep(0.05)
+        self.assertGreater(exp.stats['errors'], 0)
+        self.assertTrue(np.all(np.isnan(exp.data[:, 1:])))
+
+    def test_store(self):
+        """Test that samples beyond the buffer are kept in the store
+        """
+        counter = itertools.count()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.results')
+            experiment = Experiment(
+                devices={'count': lambda: next(counter)},
+                frequency=1000,
+                capacity=20,
+                store=path
+            )
+            with experiment:
+                time.sleep(0.1)
+            stored = ResultStore(path)
+            self.assertEqual(len(stored), experiment.stats['samples'])
+            self.assertGreater(len(stored), 20)
+            self.assertEqual(
+                stored['count'].tolist(),
+                list(range(len(stored)))
+            )
+
+    def test_no_store(self):
+        """Test that nothing is written without a store
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                with Experiment('run', devices={'a': lambda: 1.0}) as exp:
+                    time.sleep(0.01)
+                self.assertIsNone(exp.store)
+                self.assertEqual(os.listdir(tmp), [])
+            finally:
+                os.chdir(cwd)
+
+    def test_store_mismatch(self):
+        """Test that a store with other columns is refused by start
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.results')
+            with Experiment(devices={'a': lambda: 1.0}, store=path):
+                pass
+            experiment = Experiment(devices={'b': lambda: 1.0}, store=path)
+            with self.assertRaises(ValueError):
+                experiment.start()
+            self.assertIsNone(experiment.save())
+
+
+class TestTrigger(unittest.TestCase):
+    """TRIGGER mode tests
+    """
+    def test_threshold(self):
+        """Test that a capture holds the samples around the crossing
+        """
+        counter = itertools.count()
+        experiment = Experiment(
+            mode=TRIGGER,
+            devices={'ramp': lambda: next(counter)},
+            frequency=1000,
+            trigger=ThresholdTrigger('ramp', 20),
+            pre=5,
+            post=10
+        )
+        with experiment:
+            window = experiment.wait(timeout=2)
+        self.assertEqual(window[:, 1].tolist(), list(range(15, 30)))
+        self.assertEqual(len(experiment.captures), 1)
+
+    def test_software(self):
+        """Test that a software trigger is sampled straight away
+        """
+        trigger = SoftwareTrigger()
+        experiment = Experiment(
+            mode=TRIGGER,
+            devices=[lambda: 1.0],
+            frequency=2,
+            trigger=trigger,
+            pre=1,
+            post=1
+        )
+        with experiment:
+            time.sleep(0.05)
+            fired = time.time()
+            trigger.fire()
+            window = experiment.wait(timeout=0.25)
+        # The sampler is woken instead of waiting out its 0.5 s period
+        self.assertEqual(window.shape, (2, 2))
+        self.assertLess(window[-1, 0] - fired, 0.05)
+        self.assertEqual(experiment.stats['triggers'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
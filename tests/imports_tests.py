@@ -5,6 +5,12 @@ The imports module is used to provide a consistent user
 interface to people using the Xtralien Python Distribution
 and includes many common packages and functions.
 """
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 
 from os import path
@@ -36,5 +42,144 @@ class TestRunner(unittest.TestCase):
             (np.zeros((15, 9)) + 0.1).all()
         )
 
+    def test_lazy(self):
+        """Test that the scientific libraries are loaded on first use
+        """
+        loaded = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, xtralien.imports as i\n'
+            'print("scipy" in sys.modules, "matplotlib" in sys.modules)\n'
+            'i.plt\n'
+            'print("scipy" in sys.modules, "matplotlib" in sys.modules)'
+        ], env=dict(os.environ, MPLBACKEND='Agg'))
+        self.assertEqual(loaded.split(), [b'False'] * 3 + [b'True'])
+        self.assertIs(imports.rand, np.random.rand)
+        self.assertIs(imports.zeros, np.zeros)
+
+    def test_star_namespace(self):
+        """Test that the star import matches the old eager imports
+        """
+        differences = subprocess.check_output([
+            sys.executable, '-c',
+            'old = {}\n'
+            'exec("from time import *\\n'
+            'from warnings import *\\n'
+            'from scipy import *\\n'
+            'from numpy import *\\n'
+            'from numpy.random import *\\n'
+            'from matplotlib.pyplot import *", old)\n'
+            'new = {}\n'
+            'exec("from xtralien.imports import *", new)\n'
+            'deleted = {"altzone", "daylight", "timezone", "tzname",\n'
+            '           "euler_gamma"}\n'
+            'print(sorted(\n'
+            '    name for (name, value) in old.items()\n'
+            '    if not name.startswith("_") and name not in deleted\n'
+            '    and new.get(name) is not value\n'
+            '))'
+        ], env=dict(os.environ, MPLBACKEND='Agg'))
+        self.assertEqual(differences.strip(), b'[]')
+
+    def test_load_csv_mixed(self):
+        """Test loading a CSV with text and numbers in a column
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = path.join(tmp, 'mixed.csv')
+            with open(fname, 'w') as fileh:
+                fileh.write('name,v\na,1\nb,2\n3,4\n')
+            arr = imports.load_csv(fname, skip_headers=True)
+
+        self.assertEqual(arr.shape, (3, 2))
+        self.assertEqual(arr[:, 0].tolist(), ['a', 'b', 3.0])
+        self.assertEqual(arr[:, 1].tolist(), [1.0, 2.0, 4.0])
+
+    def test_iter_csv(self):
+        """Test reading a CSV in blocks
+        """
+        blocks = list(imports.iter_csv(
+            path.join(
+                path.dirname(path.realpath(__file__)),
+                'data',
+                'test_1.csv'
+            ),
+            skip_headers=True,
+            chunk_rows=4
+        ))
+        self.assertEqual([len(x) for x in blocks], [4, 4, 4, 3])
+        self.assertTrue(np.all(np.concatenate(blocks) == 0.1))
+
+    def test_load_csv_cache(self):
+        """Test that a cached CSV is memory-mapped until it changes
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = path.join(tmp, 'data.csv')
+            with open(fname, 'w') as fileh:
+                fileh.write('1,2\n3,4\n')
+            first = imports.load_csv(fname, cache=True)
+            cached = imports.load_csv(fname, cache=True)
+            self.assertIsInstance(cached, np.memmap)
+            self.assertEqual(cached.tolist(), first.tolist())
+
+            with open(fname, 'a') as fileh:
+                fileh.write('5,6\n')
+            self.assertEqual(imports.load_csv(fname, cache=True).shape, (3, 2))
+
+            # Different arguments don't share the cache
+            self.assertEqual(
+                imports.load_csv(fname, cache=True, usecols=(0,)).shape, (3,)
+            )
+            self.assertEqual(imports.load_csv(fname, cache=True).shape, (3, 2))
+
+    def test_csv_writer(self):
+        """Test appending rows from several threads
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = path.join(tmp, 'log.csv')
+            writer = imports.CSVWriter(fname, header='a,b', fmt='%g')
+            threads = [
+                threading.Thread(
+                    target=lambda: [writer.write([1, 2]) for _ in range(100)]
+                )
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            writer.write_rows(np.zeros((10, 2)))
+            writer.close()
+
+            arr = imports.load_csv(fname, skip_headers=True)
+        self.assertEqual(arr.shape, (410, 2))
+        self.assertEqual(arr.sum(), 1200)
+
+    def test_csv_writer_rotate(self):
+        """Test that the file is rotated once it is too big
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = path.join(tmp, 'log.csv')
+            with imports.CSVWriter(fname, fmt='%d', max_bytes=20) as writer:
+                for i in range(10):
+                    writer.write([i, i])
+                    writer.flush()
+            rotated = sorted(glob.glob(path.join(tmp, 'log.*.csv')))
+            self.assertEqual(len(rotated), 2)
+            with open(rotated[0]) as fileh:
+                self.assertEqual(fileh.readline(), '0,0\n')
+
+            # A second run keeps the first run's files
+            with imports.CSVWriter(fname, fmt='%d', max_bytes=20) as writer:
+                for i in range(10):
+                    writer.write([i, i])
+                    writer.flush()
+            self.assertEqual(
+                len(glob.glob(path.join(tmp, 'log.*.csv'))), 4
+            )
+            with open(rotated[0]) as fileh:
+                self.assertEqual(fileh.readline(), '0,0\n')
+            with self.assertRaises(ValueError):
+                writer.flush()
+
+
 if __name__ == "__main__":
     unittest.main()
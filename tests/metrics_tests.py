@@ -0,0 +1,96 @@
+"""Tests for command instrumentation
+"""
+import unittest
+
+from xtralien import Device, FixedPacing
+from xtralien.emulator import Emulator
+from xtralien.metrics import Histogram
+
+
+class TestMetrics(unittest.TestCase):
+    """Command metrics tests
+    """
+    def setUp(self):
+        self.emulator = Emulator(port=0, discovery_port=None, latency=0.005)
+        self.emulator.start()
+        self.addCleanup(self.emulator.close)
+        self.device = Device('127.0.0.1', self.emulator.port)
+        self.addCleanup(self.device.close)
+
+    def test_phases(self):
+        """Test that the wait for the device is counted as first byte
+        """
+        samples = []
+        self.device.connection.pacing = FixedPacing(0.001)
+        metrics = self.device.instrument(hooks=[samples.append])
+        for v in range(3):
+            self.device.smu1.oneshot(v)
+        self.device.smu1.set.voltage(1, response=0)
+
+        self.assertEqual(len(samples), 4)
+        sample = samples[0]
+        self.assertEqual(sample.path, 'smu1 oneshot')
+        self.assertEqual(sample.bytes_out, len('smu1 oneshot 0'))
+        self.assertGreater(sample.bytes_in, 0)
+        self.assertGreaterEqual(sample.sleep, 0.001)
+        self.assertGreaterEqual(sample.first_byte, 0.004)
+        self.assertGreater(sample.format, 0)
+
+        summary = metrics.summary()
+        self.assertEqual(summary['smu1 oneshot']['total']['count'], 3)
+        self.assertEqual(summary['smu1 set voltage']['drain']['count'], 1)
+
+        text = metrics.prometheus()
+        self.assertIn(
+            'xtralien_command_seconds_count'
+            '{path="smu1 oneshot",phase="first_byte"} 3',
+            text
+        )
+        self.assertIn(
+            'xtralien_command_bytes_total'
+            '{path="smu1 oneshot",direction="out"} 42',
+            text
+        )
+
+    def test_paths(self):
+        """Test that every way of sending a command is grouped by path
+        """
+        samples = []
+        self.device.instrument(hooks=[samples.append])
+        self.device.smu1.oneshot(0.1, callback=lambda r: r).result()
+        self.device('smu1 oneshot 0.2')
+        self.device.command('smu1 oneshot 0.3', True)
+        with self.device.batch() as batch:
+            batch.smu1.oneshot(0.4)
+            batch.smu1.set.voltage(1, response=0)
+        self.assertEqual(
+            [sample.path for sample in samples],
+            ['smu1 oneshot'] * 4 + ['smu1 set voltage']
+        )
+        self.assertGreater(samples[3].first_byte, 0)
+
+        # Bytes are counted before decoding
+        response = self.device.smu1.oneshot(0.1, format=None)
+        self.assertEqual(samples[-1].bytes_in, len(response.encode('utf-8')))
+
+    def test_disabled(self):
+        """Test that nothing is recorded once instrumentation is off
+        """
+        metrics = self.device.instrument()
+        self.device.metrics = None
+        self.device.smu1.measurev()
+        self.assertEqual(metrics.histograms, {})
+
+    def test_histogram(self):
+        """Test the bucket based quantiles
+        """
+        histogram = Histogram(buckets=(1, 2, 5))
+        for value in (0.5, 1.5, 1.5, 4, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Tests for the state mirror
+"""
+import unittest
+
+from xtralien import Device
+from xtralien.emulator import Emulator
+
+
+class TestMirror(unittest.TestCase):
+    """State mirror tests
+    """
+    def setUp(self):
+        self.emulator = Emulator(port=0, discovery_port=None)
+        self.emulator.start()
+        self.addCleanup(self.emulator.close)
+        self.device = Device('127.0.0.1', self.emulator.port)
+        self.addCleanup(self.device.close)
+        self.written = []
+        write = self.device.connection.write
+
+        def record(command):
+            self.written.append(command)
+            return write(command)
+        self.device.connection.write = record
+
+    def test_skip(self):
+        """Test that repeated sets are only sent once
+        """
+        mirror = self.device.mirror_state()
+        for _ in range(3):
+            self.device.smu1.set.voltage(1.0, response=0)
+            self.device.smartio.set.value.port(3, response=0)
+        self.device.smu1.set.voltage(2.0, response=0)
+        self.assertEqual(len(self.written), 3)
+        self.assertEqual((mirror.sent, mirror.saved), (3, 4))
+        self.assertEqual(mirror.saved_by_path['smu1 set voltage'], 2)
+
+        # Compiled commands are mirrored too
+        set_voltage = self.device.smu1.set.voltage.compile(response=False)
+        set_voltage(2.0)
+        self.assertEqual(len(self.written), 3)
+
+    def test_invalidate(self):
+        """Test that the mirror is forgotten when the state might change
+        """
+        mirror = self.device.mirror_state()
+        self.device.smu1.set.voltage(1.0, response=0)
+        self.device.smu2.set.voltage(1.0, response=0)
+        self.device.smu1.measurev()
+        self.assertEqual(len(mirror), 2)
+
+        self.device.smu1.oneshot(2.0)
+        self.assertEqual(len(mirror), 1)
+        self.device.smu2.reset(response=0)
+        self.assertEqual(len(mirror), 0)
+
+        self.device.smu1.set.voltage(1.0, response=0)
+        self.device.connection.opened += 1
+        del self.written[:]
+        self.device.smu1.set.voltage(1.0, response=0)
+        self.assertEqual(len(self.written), 1)
+
+        self.device.sync()
+        self.assertEqual(len(mirror), 0)
+
+    def test_metrics(self):
+        """Test that mirrored commands are grouped by path in metrics
+        """
+        self.device.mirror_state()
+        metrics = self.device.instrument()
+        for v in range(5):
+            self.device.smu1.oneshot(v)
+            self.device.smu1.set.voltage(1, response=0)
+        summary = metrics.summary()
+        self.assertEqual(
+            sorted(summary), ['smu1 oneshot', 'smu1 set voltage']
+        )
+        self.assertEqual(summary['smu1 oneshot']['format']['count'], 5)
+        self.assertGreater(summary['smu1 oneshot']['format']['mean'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Tests for command pacing
+"""
+import unittest
+
+from xtralien import Device
+from xtralien.emulator import Emulator
+from xtralien.pacing import AdaptivePacing, FixedPacing
+
+
+class TestPacing(unittest.TestCase):
+    """Pacing policy tests
+    """
+    def test_adaptive(self):
+        """Test that only unanswered writes are waited for
+        """
+        pacing = AdaptivePacing(gap=0.01, min_gap=0.001, recover=2)
+        self.assertEqual(pacing.wait_time(), 0)
+
+        pacing.sent(True)
+        pacing.received()
+        self.assertEqual(pacing.wait_time(), 0)
+
+        pacing.sent(False)
+        pacing.received()
+        self.assertGreater(pacing.wait_time(), 0.005)
+
+        pacing.failed()
+        self.assertEqual(pacing.gap, 0.02)
+        for _ in range(2):
+            pacing.sent(True)
+            pacing.received()
+        self.assertEqual(pacing.gap, 0.01)
+
+    def test_fixed(self):
+        """Test the compatibility preset
+        """
+        pacing = FixedPacing()
+        pacing.sent(True)
+        pacing.received()
+        self.assertEqual(pacing.wait_time(), 0.001)
+
+    def test_device(self):
+        """Test that a device keeps its connection's pacing up to date
+        """
+        with Emulator(port=0, discovery_port=None) as emulator:
+            device = Device('127.0.0.1', emulator.port)
+            self.addCleanup(device.close)
+            pacing = device.connection.pacing
+            device.smu1.set.voltage(1, response=0)
+            self.assertGreater(pacing.wait_time(), 0)
+            device.smu1.measurev()
+            self.assertEqual(pacing.wait_time(), 0)
+            with self.assertRaises(TimeoutError):
+                device.smu1.set.voltage(1, deadline=0.01)
+            self.assertEqual(pacing.failures, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
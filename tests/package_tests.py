@@ -0,0 +1,47 @@
+"""Tests for importing the Xtralien package
+
+The package is imported in a fresh interpreter, so that nothing has
+been imported already.
+"""
+import json
+import subprocess
+import sys
+import unittest
+
+CHECK = '''
+import json, logging, sys
+import {}
+print(json.dumps({{
+    'modules': [
+        m for m in ('numpy', 'scipy', 'matplotlib', 'serial')
+        if m in sys.modules
+    ],
+    'handlers': len(logging.getLogger().handlers),
+}}))
+'''
+
+
+class TestImport(unittest.TestCase):
+    """Package import tests
+    """
+    def test_import(self):
+        """Test that importing xtralien loads none of the slow
+        dependencies and has no side effects
+        """
+        for module in ('xtralien', 'xtralien.imports'):
+            result = json.loads(subprocess.check_output(
+                [sys.executable, '-c', CHECK.format(module)]
+            ))
+            self.assertEqual(result['modules'], [], module)
+            self.assertEqual(result['handlers'], 0, module)
+
+    def test_deferred(self):
+        """Test that numpy is still available once it is needed
+        """
+        import xtralien
+        self.assertEqual(xtralien.process_array('[1;2]').tolist(), [1, 2])
+        self.assertIs(xtralien.numpy, sys.modules['numpy'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests for the response formatters
+"""
+import unittest
+
+import numpy as np
+
+from xtralien import ResponseParser, StreamParser, process_auto
+
+
+class TestProcessAuto(unittest.TestCase):
+    """Automatic response format detection
+    """
+    def test_number(self):
+        """Test numbers are converted to floats
+        """
+        self.assertEqual(process_auto('1.5e-3\n'), 1.5e-3)
+        self.assertEqual(process_auto('-2'), -2.0)
+
+    def test_array(self):
+        """Test arrays are decoded into numpy arrays
+        """
+        np.testing.assert_array_equal(
+            process_auto('[1.0;-2.5;3e-4;]\n'),
+            np.array([1.0, -2.5, 3e-4])
+        )
+
+    def test_matrix(self):
+        """Test matrices are decoded into 2D numpy arrays
+        """
+        arr = process_auto('[1.0,2.0;3.0,4.0;5.0,6.0]\n')
+        self.assertEqual(arr.shape, (3, 2))
+        np.testing.assert_array_equal(arr[2], [5.0, 6.0])
+
+    def test_text(self):
+        """Test text responses are left as strings
+        """
+        self.assertEqual(process_auto('OK\n'), 'OK')
+        self.assertEqual(process_auto('one\ntwo\n'), ['one', 'two'])
+        self.assertEqual(process_auto('[1;two]\n'), '1;two')
+        self.assertEqual(process_auto('2 volts'), '2 volts')
+        self.assertIsNone(process_auto(None))
+
+
+class TestResponseParser(unittest.TestCase):
+    """Format caching per command
+    """
+    def test_cached_format(self):
+        """Test that a remembered format is used and corrected
+        """
+        parser = ResponseParser()
+        path = ('smu1', 'sweep')
+        self.assertEqual(parser.parse('[1,2;3,4]\n', path).shape, (2, 2))
+        self.assertEqual(parser.formats[path].__name__, 'process_matrix')
+        # A differently shaped response is still detected
+        self.assertEqual(parser.parse('[1;2;3]\n', path).shape, (3,))
+        self.assertEqual(parser.parse('Error\n', path), 'Error')
+        self.assertEqual(parser.formats[path].__name__, 'process_array')
+
+
+class TestStreamParser(unittest.TestCase):
+    """Incremental decoding
+    """
+    def test_array_pieces(self):
+        """Test an array split mid-number decodes into fixed blocks
+        """
+        parser = StreamParser(rows=4)
+        blocks = []
+        for piece in (b'[1.5;2', b'.5;3e', b'-1;4;5;6', b';7]\n'):
+            blocks += parser.feed(piece)
+        blocks.append(parser.finish())
+        self.assertEqual(
+            [b.tolist() for b in blocks],
+            [[1.5, 2.5, 0.3, 4.0], [5.0, 6.0, 7.0]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
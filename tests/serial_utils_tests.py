@@ -0,0 +1,103 @@
+"""Tests for finding serial ports
+
+A temporary directory stands in for sysfs and probing is stubbed out.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from xtralien import serial_utils
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "sysfs is Linux only")
+class TestSerialPorts(unittest.TestCase):
+    """Serial port listing tests
+    """
+    def setUp(self):
+        self.sysfs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sysfs)
+        os.makedirs(os.path.join(self.sysfs, 'class', 'tty'))
+        patcher = mock.patch.object(serial_utils, '_sysfs', self.sysfs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        serial_utils._cache['candidates'] = None
+
+        self.probed = []
+        self.lock = threading.Lock()
+        self.available = set()
+
+        def probe(port):
+            with self.lock:
+                self.probed.append(port)
+            time.sleep(0.05)
+            return port in self.available
+        patcher = mock.patch.object(serial_utils, '_probe', probe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_tty(self, name, parent, ids=None):
+        """Add a tty under the device `parent`, which is a USB device
+        with the (vendor, product) `ids` if given
+        """
+        device = os.path.join(self.sysfs, 'devices', parent)
+        if ids is not None:
+            os.makedirs(device, exist_ok=True)
+            for (field, value) in zip(('idVendor', 'idProduct'), ids):
+                with open(os.path.join(device, field), 'w') as f:
+                    f.write(value + '\n')
+        tty = os.path.join(device, '1.0', 'tty', name)
+        os.makedirs(tty)
+        os.makedirs(os.path.join(self.sysfs, 'class', 'tty', name))
+        os.symlink(
+            tty,
+            os.path.join(self.sysfs, 'class', 'tty', name, 'device')
+        )
+
+    def test_usb_filter(self):
+        """Test that only USB ports, matching the IDs if given, are listed
+        """
+        self.add_tty('ttyACM0', 'pci0/usb1/1-1', ('0483', '5740'))
+        self.add_tty('ttyUSB0', 'pci0/usb1/1-2', ('0403', '6001'))
+        self.add_tty('ttyS0', 'platform/serial8250')
+
+        self.assertEqual(
+            serial_utils._usb_serial_ports(()),
+            ['/dev/ttyACM0', '/dev/ttyUSB0']
+        )
+        self.assertEqual(
+            serial_utils._usb_serial_ports((('0483', '5740'),)),
+            ['/dev/ttyACM0']
+        )
+
+    def test_probe_and_cache(self):
+        """Test that ports are probed in parallel and cached until they
+        change
+        """
+        for i in range(4):
+            self.add_tty('ttyACM%d' % i, 'pci0/usb1/1-%d' % i, ('0483', '1'))
+        self.available = {'/dev/ttyACM1', '/dev/ttyACM3'}
+
+        start = time.perf_counter()
+        ports = serial_utils.serial_ports()
+        self.assertLess(time.perf_counter() - start, 0.15)
+        self.assertEqual(ports, ['/dev/ttyACM1', '/dev/ttyACM3'])
+        self.assertEqual(len(self.probed), 4)
+
+        self.assertEqual(serial_utils.serial_ports(), ports)
+        self.assertEqual(len(self.probed), 4)
+
+        self.add_tty('ttyACM4', 'pci0/usb1/1-4', ('0483', '1'))
+        serial_utils.serial_ports()
+        self.assertEqual(len(self.probed), 9)
+
+        serial_utils.serial_ports(refresh=True)
+        self.assertEqual(len(self.probed), 14)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests for the Xtralien result store
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from xtralien.storage import ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+    """ResultStore tests
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'run.results')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append(self):
+        """Test that rows spanning segments read back in order
+        """
+        rows = np.arange(50, dtype=float).reshape(25, 2)
+        with ResultStore(self.path, ['a', 'b'], segment_rows=8) as store:
+            store.append(rows[:10])
+            store.append(rows[10:])
+
+        store = ResultStore(self.path)
+        self.assertEqual(len(store), 25)
+        self.assertEqual(store['b'].tolist(), rows[:, 1].tolist())
+        self.assertEqual(store.read().tolist(), rows.tolist())
+        for part in store.segments('a'):
+            self.assertIsInstance(part, np.memmap)
+
+    def test_unflushed(self):
+        """Test that only flushed rows are visible after a crash
+        """
+        store = ResultStore(self.path, ['a'], segment_rows=8)
+        store.append([[1.0], [2.0]])
+        store.flush()
+        store.append([[3.0]])
+        # Abandoned without closing
+        reopened = ResultStore(self.path, ['a'])
+        self.assertEqual(reopened['a'].tolist(), [1.0, 2.0])
+        reopened.append([[4.0]])
+        reopened.close()
+        self.assertEqual(ResultStore(self.path)['a'].tolist(), [1.0, 2.0, 4.0])
+
+    def test_columns(self):
+        """Test that reopening with different columns fails
+        """
+        ResultStore(self.path, ['a']).close()
+        with self.assertRaises(ValueError):
+            ResultStore(self.path, ['a', 'b'])
+
+
+if __name__ == "__main__":
+    unittest.main()
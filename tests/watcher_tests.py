@@ -0,0 +1,96 @@
+"""Tests for the device watcher
+
+A temporary directory stands in for /dev.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from xtralien import watcher as watcher_module
+from xtralien.watcher import ATTACHED, DETACHED, DeviceWatcher
+
+
+class TestDeviceWatcher(unittest.TestCase):
+    """Device watcher tests
+    """
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def watcher(self, **kwargs):
+        watcher = DeviceWatcher(
+            path=self.path,
+            lister=lambda: os.listdir(self.path),
+            **kwargs
+        )
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def attach(self, name):
+        open(os.path.join(self.path, name), 'w').close()
+
+    def check_changes(self, watcher):
+        self.assertEqual(watcher.changes(timeout=0.05), [])
+        self.attach('ttyACM0')
+        self.assertEqual(
+            watcher.changes(timeout=2.0),
+            [(ATTACHED, 'ttyACM0')]
+        )
+        os.remove(os.path.join(self.path, 'ttyACM0'))
+        self.assertEqual(
+            watcher.changes(timeout=2.0),
+            [(DETACHED, 'ttyACM0')]
+        )
+
+    def test_inotify(self):
+        """Test that changes are picked up through inotify
+        """
+        watcher = self.watcher()
+        if not watcher.inotify:
+            self.skipTest("inotify is not available")
+        self.check_changes(watcher)
+
+    def test_polling(self):
+        """Test that changes are picked up by polling
+        """
+        self.check_changes(self.watcher(use_inotify=False, poll_interval=0.01))
+
+    def test_no_libc(self):
+        """Test that polling is used where libc or inotify can't be found
+        """
+        with mock.patch('ctypes.util.find_library', return_value=None):
+            watcher = self.watcher(poll_interval=0.01)
+        self.assertFalse(watcher.inotify)
+        self.check_changes(watcher)
+
+        with mock.patch.object(watcher_module.sys, 'platform', 'win32'):
+            self.assertFalse(self.watcher().inotify)
+
+    def test_wait_for_device(self):
+        """Test waiting for a device to be attached
+        """
+        watcher = self.watcher()
+        with self.assertRaises(TimeoutError):
+            watcher.wait_for_device(timeout=0.05)
+        threading.Timer(0.05, self.attach, args=('ttyUSB0',)).start()
+        self.assertEqual(watcher.wait_for_device(timeout=2.0), 'ttyUSB0')
+
+    def test_callbacks(self):
+        """Test that callbacks are called from the watcher thread
+        """
+        watcher = self.watcher()
+        attached = threading.Event()
+        watcher.on_attach(lambda port: attached.set())
+        start = time.perf_counter()
+        self.attach('ttyUSB1')
+        self.assertTrue(attached.wait(2.0))
+        if watcher.inotify:
+            self.assertLess(time.perf_counter() - start, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()